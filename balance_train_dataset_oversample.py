@@ -1,76 +1,69 @@
+import argparse
 import pandas as pd
-import numpy as np
-from sklearn.utils import resample
+from balancing import (BALANCE_STRATEGIES, balanced_indices, example_weights, load_indices, save_indices,
+                       write_expanded_jsonl, write_weighted_jsonl)
+from config import TRAIN_FILE, BALANCE_STRATEGY, BALANCED_TRAIN, PROMPT_LAYOUT
 from data_prep import prepare_data
 
-# Load and prepare the data
-data = prepare_data('data/train/train.csv', is_train=True)
-
-def selective_oversample(df, condition, n_samples):
-    subset = df[condition]
-    if len(subset) == 0:
-        return pd.DataFrame()
-    return resample(subset, replace=True, n_samples=n_samples, random_state=42)
-
-# Original counts
-original_survivors = len(data[data['Survived'] == 1])
-original_non_survivors = len(data[data['Survived'] == 0])
-
-# Oversample based on historical factors
-balanced_data = pd.DataFrame()
-
-# 1. Women and children in first and second class (high survival rate)
-balanced_data = pd.concat([balanced_data, selective_oversample(
-    data, (data['Survived'] == 1) & (data['Sex'] == 'female') & (data['Pclass'].isin([1, 2])) | 
-          (data['Survived'] == 1) & (data['AgeBin'] == 'Child') & (data['Pclass'].isin([1, 2])), 
-    n_samples=int(original_non_survivors * 0.2))])
-
-# 2. Men in first class (moderate survival rate)
-balanced_data = pd.concat([balanced_data, selective_oversample(
-    data, (data['Survived'] == 1) & (data['Sex'] == 'male') & (data['Pclass'] == 1), 
-    n_samples=int(original_non_survivors * 0.1))])
-
-# 3. Women and children in third class (lower survival rate)
-balanced_data = pd.concat([balanced_data, selective_oversample(
-    data, (data['Survived'] == 1) & ((data['Sex'] == 'female') | (data['AgeBin'] == 'Child')) & (data['Pclass'] == 3), 
-    n_samples=int(original_non_survivors * 0.1))])
-
-# 4. Passengers with family (some survived)
-balanced_data = pd.concat([balanced_data, selective_oversample(
-    data, (data['Survived'] == 1) & (data['FamilySize'] > 1), 
-    n_samples=int(original_non_survivors * 0.05))])
-
-# 5. Add remaining survivors to reach balance
-remaining_survivors_needed = original_non_survivors - len(balanced_data)
-balanced_data = pd.concat([balanced_data, selective_oversample(
-    data, (data['Survived'] == 1) & (~data.index.isin(balanced_data.index)), 
-    n_samples=remaining_survivors_needed)])
-
-# Add all original non-survivors
-balanced_data = pd.concat([balanced_data, data[data['Survived'] == 0]])
-
-# Shuffle the dataset
-balanced_data = balanced_data.sample(frac=1, random_state=42).reset_index(drop=True)
-
-# Display the new class distribution
-print(balanced_data['Survived'].value_counts())
-
-# Save the balanced dataset
-balanced_data.to_csv('data/train/balanced_train.csv', index=False)
-
-print("Historically balanced dataset saved as 'balanced_train.csv'")
-
-# Additional statistics
-print("\nClass distribution in balanced dataset:")
-print(balanced_data['Pclass'].value_counts(normalize=True))
-
-print("\nGender distribution in balanced dataset:")
-print(balanced_data['Sex'].value_counts(normalize=True))
-
-print("\nAge distribution in balanced dataset:")
-print(balanced_data['AgeBin'].value_counts(normalize=True))
-
-print("\nAverage family size in balanced dataset:", balanced_data['FamilySize'].mean())
-
-print("\nSocial Status distribution in balanced dataset:")
-print(balanced_data['SocialStatus'].value_counts(normalize=True).head())
\ No newline at end of file
+OUTPUT_FORMATS = ("csv", "jsonl", "weighted", "indices")
+
+def print_distribution(data, indices):
+    # Distributions of the oversampled set, computed from the row counts instead of a copied frame
+    weights = pd.Series(example_weights(indices, len(data)), index=data.index)
+
+    def share(column):
+        return (weights.groupby(data[column]).sum() / weights.sum()).sort_values(ascending=False)
+
+    print(weights.groupby(data['Survived']).sum().sort_values(ascending=False))
+
+    print("\nClass distribution in balanced dataset:")
+    print(share('Pclass'))
+
+    print("\nGender distribution in balanced dataset:")
+    print(share('Sex'))
+
+    print("\nAge distribution in balanced dataset:")
+    print(share('AgeBin'))
+
+    print("\nAverage family size in balanced dataset:", (data['FamilySize'] * weights).sum() / weights.sum())
+
+    print("\nSocial Status distribution in balanced dataset:")
+    print(share('SocialStatus').head())
+
+def main():
+    parser = argparse.ArgumentParser(description="Oversample survivors in the training data")
+    parser.add_argument('--strategy', choices=BALANCE_STRATEGIES, default=BALANCE_STRATEGY)
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default="csv",
+                        help="csv: prepared rows with repeats (the original output); jsonl: training examples "
+                             "with repeats, for fine-tuning; weighted: each example once with a top-level 'weight', "
+                             "for local use only (fine-tuning ignores it and fine_tune.py refuses such files); "
+                             "indices: row positions only, expanded later with --from-indices")
+    parser.add_argument('--output', default=BALANCED_TRAIN)
+    parser.add_argument('--from-indices', default=None,
+                        help="expand a file written with --format indices instead of drawing the samples again")
+    args = parser.parse_args()
+    if args.from_indices and args.format == "indices":
+        parser.error("--from-indices needs an output format other than indices")
+
+    # Load and prepare the data
+    data = prepare_data(TRAIN_FILE, is_train=True)
+    if args.from_indices:
+        indices, args.strategy = load_indices(args.from_indices, len(data))
+    else:
+        indices = balanced_indices(data, args.strategy)
+
+    if args.format == "csv":
+        data.iloc[indices].to_csv(args.output, index=False)
+    elif args.format == "jsonl":
+        write_expanded_jsonl(data, indices, args.output, layout=PROMPT_LAYOUT)
+    elif args.format == "weighted":
+        n_examples = write_weighted_jsonl(data, indices, args.output, layout=PROMPT_LAYOUT)
+        print(f"{n_examples} distinct examples stand in for {len(indices)} oversampled ones")
+    else:
+        save_indices(indices, args.output, args.strategy, len(data))
+
+    print_distribution(data, indices)
+    print(f"\nBalanced dataset ({args.strategy}, {args.format}) saved as '{args.output}'")
+
+if __name__ == "__main__":
+    main()
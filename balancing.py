@@ -0,0 +1,111 @@
+import json
+import numpy as np
+from prompt_renderer import render_train_lines
+from utils.jsonl_io import JsonlWriter
+
+# Oversampling works on row positions of the prepared training data: a strategy returns an array
+# of positions (repeats allowed) and nothing is copied until the JSONL is written
+BALANCE_STRATEGIES = ("historical", "sex_pclass")
+
+def oversample(candidates, n_samples, random_state=42):
+    # Same draw as sklearn.utils.resample(subset, replace=True, n_samples=n_samples, random_state=random_state)
+    if len(candidates) == 0 or n_samples <= 0:
+        return np.empty(0, dtype=int)
+    return candidates[np.random.RandomState(random_state).randint(0, len(candidates), size=n_samples)]
+
+def shuffle(indices, random_state=42):
+    # Same order as DataFrame.sample(frac=1, random_state=random_state)
+    return indices[np.random.RandomState(random_state).choice(len(indices), size=len(indices), replace=False)]
+
+def historical_indices(data, random_state=42):
+    # Survivors are oversampled by historical survival factors until they match the non-survivors
+    survived = data['Survived'].to_numpy() == 1
+    female = data['Sex'].to_numpy() == 'female'
+    child = data['AgeBin'].to_numpy() == 'Child'
+    pclass = data['Pclass'].to_numpy()
+    upper_class = np.isin(pclass, [1, 2])
+    n_non_survivors = int((~survived).sum())
+
+    strata = [
+        # 1. Women and children in first and second class (high survival rate)
+        (survived & female & upper_class | survived & child & upper_class, int(n_non_survivors * 0.2)),
+        # 2. Men in first class (moderate survival rate)
+        (survived & ~female & (pclass == 1), int(n_non_survivors * 0.1)),
+        # 3. Women and children in third class (lower survival rate)
+        (survived & (female | child) & (pclass == 3), int(n_non_survivors * 0.1)),
+        # 4. Passengers with family (some survived)
+        (survived & (data['FamilySize'].to_numpy() > 1), int(n_non_survivors * 0.05)),
+    ]
+    picked = [oversample(np.flatnonzero(mask), n_samples, random_state) for mask, n_samples in strata]
+
+    # 5. Survivors not drawn so far fill the rest of the gap
+    n_picked = sum(len(positions) for positions in picked)
+    not_picked = np.ones(len(data), dtype=bool)
+    not_picked[np.concatenate(picked)] = False
+    picked.append(oversample(np.flatnonzero(survived & not_picked), n_non_survivors - n_picked, random_state))
+
+    # All original non-survivors
+    picked.append(np.flatnonzero(~survived))
+    return shuffle(np.concatenate(picked), random_state)
+
+def sex_pclass_indices(data, random_state=42):
+    # Every passenger once, plus extra survivors drawn within each Sex x Pclass stratum in proportion
+    # to its survivors, so the survivors keep their Sex x Pclass mix
+    survived = data['Survived'].to_numpy() == 1
+    strata = data.groupby(['Sex', 'Pclass']).indices
+    n_extra = int((~survived).sum() - survived.sum())
+
+    survivors = {key: positions[survived[positions]] for key, positions in strata.items()}
+    shares = np.array([len(positions) for positions in survivors.values()]) / max(1, survived.sum())
+    quotas = np.floor(shares * max(0, n_extra)).astype(int)
+    # Largest remainders get the samples lost to rounding
+    for i in np.argsort(-(shares * max(0, n_extra) - quotas))[:max(0, n_extra) - quotas.sum()]:
+        quotas[i] += 1
+
+    picked = [np.arange(len(data))]
+    picked += [oversample(positions, quota, random_state) for positions, quota in zip(survivors.values(), quotas)]
+    return shuffle(np.concatenate(picked), random_state)
+
+STRATEGY_FUNCTIONS = {
+    "historical": historical_indices,
+    "sex_pclass": sex_pclass_indices,
+}
+
+def balanced_indices(data, strategy="historical", random_state=42):
+    if strategy not in STRATEGY_FUNCTIONS:
+        raise ValueError(f"Unknown balancing strategy {strategy!r}; choose from {BALANCE_STRATEGIES}")
+    return STRATEGY_FUNCTIONS[strategy](data, random_state)
+
+def example_weights(indices, n_rows):
+    # How many times each row occurs in the oversampled set
+    return np.bincount(indices, minlength=n_rows)
+
+def save_indices(indices, path, strategy, n_rows):
+    with open(path, 'w') as f:
+        json.dump({"strategy": strategy, "rows": n_rows, "indices": indices.tolist()}, f)
+
+def load_indices(path, n_rows):
+    # Positions only make sense for the prepared data they were drawn from
+    with open(path, 'r') as f:
+        saved = json.load(f)
+    indices = np.array(saved["indices"], dtype=int)
+    if saved.get("rows", n_rows) != n_rows or (len(indices) and (indices.min() < 0 or indices.max() >= n_rows)):
+        raise ValueError(f"{path} holds row positions for {saved.get('rows')} rows, not the {n_rows} prepared rows")
+    return indices, saved["strategy"]
+
+def write_expanded_jsonl(data, indices, output_file, layout="classic"):
+    # Each distinct row is rendered once; repeats reuse its line
+    unique, inverse = np.unique(indices, return_inverse=True)
+    lines = render_train_lines(data.iloc[unique], layout=layout)
+    with JsonlWriter(output_file) as writer:
+        writer.write_lines(lines[i] for i in inverse)
+    return len(indices)
+
+def write_weighted_jsonl(data, indices, output_file, layout="classic"):
+    # Deduplicated examples; repeats become a per-example "weight" instead of extra copies
+    weights = example_weights(indices, len(data))
+    kept = np.flatnonzero(weights)
+    lines = render_train_lines(data.iloc[kept], layout=layout)
+    with JsonlWriter(output_file) as writer:
+        writer.write_lines(line[:-2] + f', "weight": {weights[row]}}}\n' for line, row in zip(lines, kept))
+    return len(kept)
@@ -0,0 +1,128 @@
+from openai import OpenAI
+from openai.types.chat import ChatCompletion
+import argparse
+import json
+import time
+from config import (TEST_OUTPUT, SUBMISSION_FILENAME, MODEL_RESPONSES, PREDICTION_JOURNAL,
+                    BATCH_INPUT, MODEL)
+from fine_tune import upload_file
+from generate_llm_based_predictions import iter_test_data, journal_record
+from inference import backoff_delay
+from journal import PredictionJournal, build_outputs_from_journal
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+def create_batch_input(test_path, batch_path, model):
+    # One Batch API request per passenger, identified by its PassengerId
+    n_requests = 0
+    with open(batch_path, 'w') as f:
+        for entry in iter_test_data(test_path):
+            request = {
+                "custom_id": str(entry["PassengerId"]),
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {"model": model, "messages": entry["messages"]}
+            }
+            f.write(json.dumps(request) + '\n')
+            n_requests += 1
+    print(f"Batch input with {n_requests} requests saved to {batch_path}")
+    return n_requests
+
+def start_batch(client, file_id):
+    print(f"Starting batch with file ID: {file_id}")
+    try:
+        batch = client.batches.create(
+            input_file_id=file_id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h"
+        )
+        print(f"Batch created successfully. Batch ID: {batch.id}")
+        return batch.id
+    except Exception as e:
+        print(f"Error starting batch: {str(e)}")
+        return None
+
+def wait_for_batch(client, batch_id, base_delay=5.0, max_delay=300.0):
+    print("Waiting for batch to complete...")
+    attempt = 0
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        if batch.status in TERMINAL_STATUSES:
+            print(f"Batch finished with status: {batch.status}")
+            return batch
+        counts = batch.request_counts
+        if counts is not None:
+            print(f"Batch {batch.status}: {counts.completed}/{counts.total} completed, {counts.failed} failed")
+        else:
+            print(f"Batch {batch.status}. Waiting...")
+        time.sleep(base_delay + backoff_delay(attempt, base=base_delay, cap=max_delay))
+        attempt += 1
+
+def iter_file_lines(client, file_id):
+    if not file_id:
+        return
+    content = client.files.content(file_id)
+    for line in content.iter_lines():
+        if line.strip():
+            yield json.loads(line)
+
+def batch_result(line):
+    passenger_id = int(line["custom_id"])
+    response = line.get("response") or {}
+    if line.get("error") is None and response.get("status_code") == 200:
+        return {"PassengerId": passenger_id, "response": ChatCompletion.model_validate(response["body"]), "error": None}
+
+    error = line.get("error") or response.get("body", {}).get("error") or f"status {response.get('status_code')}"
+    if isinstance(error, dict):
+        error = error.get("message", error)
+    return {"PassengerId": passenger_id, "response": None, "error": error}
+
+def journal_batch_results(client, batch, journal):
+    n_results = 0
+    # Failed requests are listed in the error file rather than the output file
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        for line in iter_file_lines(client, file_id):
+            journal.append(journal_record(batch_result(line)))
+            n_results += 1
+    print(f"Journaled {n_results} batch results")
+    return n_results
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the test set offline with the OpenAI Batch API")
+    parser.add_argument('--input', default=TEST_OUTPUT, help="formatted JSONL test data")
+    parser.add_argument('--model', default=MODEL)
+    parser.add_argument('--batch-id', help="resume polling an existing batch instead of submitting a new one")
+    parser.add_argument('--journal', default=PREDICTION_JOURNAL)
+    parser.add_argument('--base-url', help="API base URL, e.g. a local stand-in server")
+    args = parser.parse_args()
+
+    client = OpenAI(base_url=args.base_url) if args.base_url else OpenAI()
+
+    batch_id = args.batch_id
+    if not batch_id:
+        create_batch_input(args.input, BATCH_INPUT, args.model)
+        file_id = upload_file(client, BATCH_INPUT, purpose="batch")
+        if not file_id:
+            return
+        batch_id = start_batch(client, file_id)
+        if not batch_id:
+            return
+        print(f"If polling is interrupted, resume with: --batch-id {batch_id}")
+
+    batch = wait_for_batch(client, batch_id)
+    if batch.status != "completed":
+        print(f"Batch {batch_id} did not complete: {batch.errors}")
+        if not batch.output_file_id and not batch.error_file_id:
+            return
+
+    journal = PredictionJournal(args.journal)
+    try:
+        journal_batch_results(client, batch, journal)
+    finally:
+        journal.close()
+
+    build_outputs_from_journal(args.journal, SUBMISSION_FILENAME, MODEL_RESPONSES)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from openai.types.chat import ChatCompletion
+from cli import COMMANDS
+from config import TRAIN_FILE, TEST_FILE, MAX_CONCURRENCY, BENCHMARK_RESULTS
+from data_prep import FeaturePipeline, prepare_data
+from inference import parse_survival_prediction, predict_all
+from journal import PredictionJournal, build_outputs_from_journal
+from main import create_train_jsonl, create_test_jsonl
+from prompt_renderer import render_assistant_messages
+from prompts import generate_prompt
+from utils.cost_estimation import estimate_cost, get_encoding
+from utils.format_validation import check_format
+from utils.jsonl_io import iter_jsonl
+
+# Synthetic datasets are these multiples of the Kaggle files
+SCALES = [10, 100, 1000]
+# generate_prompt is row-wise (iterrows); time it on at most this many rows and report the rate
+ROWWISE_ROWS = 20000
+STARTUP_TOP_IMPORTS = 5  # heaviest top-level imports kept per cli.py command
+# --check-startup: these invocations must not import any of HEAVY_MODULES
+LIGHT_COMMANDS = ([], ['validate'], ['estimate'])
+HEAVY_MODULES = ("pandas", "sklearn", "openai", "tiktoken")
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FAKE_REPLY = ("Considering the passenger's class, sex and age, the passenger most likely survived.\n\n"
+              "Final prediction: Survived")
+
+class FakeChatCompletions:
+    # Answers every request instantly with the same canned completion, so the inference stages
+    # measure this repo's own overhead (queueing, journaling, parsing) and need no network
+    def __init__(self):
+        self.response = ChatCompletion.model_validate({
+            "id": "chatcmpl-benchmark", "object": "chat.completion", "created": 0, "model": "benchmark",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": FAKE_REPLY}}],
+            "usage": {"prompt_tokens": 600, "completion_tokens": 30, "total_tokens": 630},
+        })
+
+    async def create(self, model, messages, **params):
+        await asyncio.sleep(0)
+        return self.response
+
+class FakeAsyncClient:
+    def __init__(self):
+        self.chat = type("FakeChat", (), {"completions": FakeChatCompletions()})()
+
+def synthesize_passengers(source, n_rows, seed=42, first_id=1):
+    # Rows are resampled from the real file (so Sex, Pclass, Fare, ... stay consistent with each other),
+    # then surnames, ages and fares are shuffled or jittered so the prompts are not just copies
+    rng = np.random.default_rng(seed)
+    df = source.iloc[rng.integers(0, len(source), n_rows)].reset_index(drop=True)
+    df['PassengerId'] = np.arange(first_id, first_id + n_rows)
+
+    last_names = source['Name'].str.split(',').str[0].to_numpy()
+    given_names = df['Name'].str.split(',', n=1).str[1]
+    df['Name'] = last_names[rng.integers(0, len(last_names), n_rows)] + ',' + given_names
+
+    age_noise = rng.integers(-3, 4, n_rows)
+    df['Age'] = (df['Age'] + age_noise).clip(lower=0.42)
+    df['Fare'] = (df['Fare'] * rng.uniform(0.9, 1.1, n_rows)).round(4)
+    return df
+
+def measure(function, *args, **kwargs):
+    # Wall time and peak traced Python memory of one call; tracemalloc slows every stage by a similar
+    # factor, so numbers are comparable between commits rather than absolute
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"seconds": round(seconds, 4), "peak_mb": round(peak / 2 ** 20, 2)}
+
+def run_inference(test_output, journal_path):
+    journal = PredictionJournal(journal_path)
+    try:
+        asyncio.run(predict_all(
+            iter_jsonl(test_output), model="benchmark", concurrency=MAX_CONCURRENCY, client=FakeAsyncClient(),
+            on_result=lambda result: journal.append({
+                "PassengerId": result["PassengerId"], "ModelResponse": result["response"].choices[0].message.content,
+                "Survived": parse_survival_prediction(result["response"].choices[0].message), "Error": None,
+            })
+        ))
+    finally:
+        journal.close()
+
+def tokenizer_available():
+    # tiktoken downloads its encoding on first use; offline that only works once it is cached
+    try:
+        get_encoding()
+        return True
+    except Exception:
+        return False
+
+def benchmark_scale(scale, work_dir, rowwise_rows=ROWWISE_ROWS, seed=42):
+    train_source, test_source = pd.read_csv(TRAIN_FILE), pd.read_csv(TEST_FILE)
+    train = synthesize_passengers(train_source, len(train_source) * scale, seed)
+    test = synthesize_passengers(test_source, len(test_source) * scale, seed + 1, first_id=len(train) + 1)
+
+    paths = {name: os.path.join(work_dir, f"{name}_{scale}x{ext}") for name, ext in [
+        ("train", ".csv"), ("test", ".csv"), ("train_output", ".jsonl"), ("test_output", ".jsonl"),
+        ("journal", ".jsonl"), ("submission", ".csv"), ("responses", ".json")]}
+    train.to_csv(paths["train"], index=False)
+    test.to_csv(paths["test"], index=False)
+    del train, test
+
+    stages = {}
+    train_data, stages["prepare_data"] = measure(prepare_data, paths["train"])
+    pipeline = FeaturePipeline().fit(pd.read_csv(paths["train"]))
+    test_data, stages["transform_test"] = measure(pipeline.transform, pd.read_csv(paths["test"]), False)
+
+    sample = train_data.head(rowwise_rows)
+    _, stages["generate_prompt"] = measure(lambda: [generate_prompt(row) for _, row in sample.iterrows()])
+    stages["generate_prompt"]["rows"] = len(sample)
+
+    _, stages["create_train_jsonl"] = measure(create_train_jsonl, train_data, paths["train_output"])
+    _, stages["create_test_jsonl"] = measure(create_test_jsonl, test_data, paths["test_output"])
+
+    if tokenizer_available():
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, stages["estimate_cost"] = measure(estimate_cost, iter_jsonl(paths["train_output"]))
+    else:
+        stages["estimate_cost"] = {"skipped": "tiktoken encoding is not cached and cannot be downloaded"}
+    _, stages["format_validation"] = measure(check_format, iter_jsonl(paths["train_output"]))
+
+    answers = render_assistant_messages(train_data)
+    _, stages["parse_survival_prediction"] = measure(lambda: [parse_survival_prediction(a) for a in answers])
+    del answers
+
+    _, stages["predict_all"] = measure(run_inference, paths["test_output"], paths["journal"])
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, stages["build_outputs"] = measure(build_outputs_from_journal, paths["journal"],
+                                             paths["submission"], paths["responses"])
+
+    for path in paths.values():
+        os.remove(path)
+    return {"train_rows": len(train_data), "test_rows": len(test_data), "stages": stages}
+
+def import_times(cli_args):
+    # Runs `cli.py <cli_args> --help` (so nothing runs) under python -X importtime; returns the wall
+    # time and (module, cumulative microseconds, nested) for every import
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', os.path.join(CODE_DIR, 'cli.py'), *cli_args, '--help'],
+                             capture_output=True, text=True, check=True)
+    seconds = time.perf_counter() - started
+    imports = []
+    for line in process.stderr.splitlines():
+        fields = line.removeprefix('import time:').split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2][1:]
+        imports.append((name.strip(), int(fields[1]), name.startswith(' ')))  # nested imports are indented
+    return seconds, imports
+
+def startup_time(command):
+    # Startup of one cli.py command: wall time, and the cumulative import milliseconds of every top-level import
+    seconds, imports = import_times([command])
+    top_level = {name: us / 1000 for name, us, nested in imports if not nested}
+    heaviest = sorted(top_level.items(), key=lambda item: -item[1])[:STARTUP_TOP_IMPORTS]
+    return {"seconds": round(seconds, 4), "import_ms": round(sum(top_level.values()), 1),
+            "heaviest_imports_ms": {name: round(ms, 1) for name, ms in heaviest}}
+
+def check_startup():
+    # Heavy packages pulled in by the light commands, as {"cli.py validate": ["pandas", ...]}
+    violations = {}
+    for cli_args in LIGHT_COMMANDS:
+        _, imports = import_times(cli_args)
+        heavy = sorted({name.split('.')[0] for name, _, _ in imports} & set(HEAVY_MODULES))
+        if heavy:
+            violations[" ".join(["cli.py", *cli_args])] = heavy
+    return violations
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on synthetic data, fully offline")
+    parser.add_argument('--scales', type=int, nargs='*', default=SCALES,
+                        help="dataset sizes as multiples of the Kaggle train/test files (none: startup only)")
+    parser.add_argument('--rowwise-rows', type=int, default=ROWWISE_ROWS,
+                        help="rows used for the row-wise generate_prompt stage")
+    parser.add_argument('--output', default=BENCHMARK_RESULTS,
+                        help="JSONL file that gets one record appended per run")
+    parser.add_argument('--no-startup', action='store_true', help="skip the cli.py startup/import times")
+    parser.add_argument('--check-startup', action='store_true',
+                        help=f"only check that {', '.join(' '.join(['cli.py', *c]) for c in LIGHT_COMMANDS)} "
+                             f"import none of {', '.join(HEAVY_MODULES)}; exits 1 if they do")
+    args = parser.parse_args()
+
+    if args.check_startup:
+        violations = check_startup()
+        for command, heavy in violations.items():
+            print(f"{command} --help imports {', '.join(heavy)}")
+        if violations:
+            sys.exit(1)
+        print(f"Light commands import none of {', '.join(HEAVY_MODULES)}")
+        return
+
+    run = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scales": {},
+        "startup": {},
+    }
+    if not args.no_startup:
+        print("cli.py startup (--help):")
+        for command in COMMANDS:
+            result = startup_time(command)
+            run["startup"][command] = result
+            heaviest = ", ".join(f"{name} {ms:.0f}ms" for name, ms in list(result["heaviest_imports_ms"].items())[:3])
+            print(f"  {command:>10} {result['seconds'] * 1000:>7.0f}ms wall {result['import_ms']:>7.0f}ms imports ({heaviest})")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for scale in args.scales:
+            result = benchmark_scale(scale, work_dir, args.rowwise_rows)
+            run["scales"][f"{scale}x"] = result
+            print(f"{scale}x: {result['train_rows']} train / {result['test_rows']} test passengers")
+            for stage, stats in result["stages"].items():
+                if "skipped" in stats:
+                    print(f"  {stage:>26} skipped: {stats['skipped']}")
+                else:
+                    print(f"  {stage:>26} {stats['seconds']:>9.3f}s {stats['peak_mb']:>9.1f} MB")
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(run) + '\n')
+    print(f"Results appended to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+from utils.jsonl_io import JsonlWriter
+
+# Source files whose changes can alter the rendered JSONL
+CODE_FILES = ['config.py', 'data_prep.py', 'prompts.py', 'prompt_renderer.py', 'main.py', 'build_manifest.py']
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def hash_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_values(*values):
+    return hashlib.sha256(json.dumps(values).encode()).hexdigest()
+
+def hash_code(*settings):
+    return hash_values([hash_file(os.path.join(CODE_DIR, name)) for name in CODE_FILES], *settings)
+
+def hash_rows(data):
+    # One 64-bit hash per prepared row, over every feature the prompts could read. pandas is
+    # imported here so that hash_file users (fine_tune.py) don't pay for it
+    import pandas as pd
+    return pd.util.hash_pandas_object(data, index=False).tolist()
+
+def manifest_path(output_file):
+    return output_file + '.manifest.json'
+
+def load_manifest(output_file):
+    path = manifest_path(output_file)
+    if not os.path.exists(path) or not os.path.exists(output_file):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_manifest(output_file, manifest):
+    with open(manifest_path(output_file), 'w') as f:
+        json.dump(manifest, f)
+
+def is_up_to_date(output_file, fingerprint):
+    manifest = load_manifest(output_file)
+    return manifest is not None and manifest["fingerprint"] == fingerprint
+
+def _line_offsets(output_file, manifest):
+    # (row key, row hash) -> byte offset of that row's line in the previous output
+    offsets = {}
+    with open(output_file, 'rb') as f:
+        for key, row_hash in zip(manifest["row_keys"], manifest["row_hashes"]):
+            offsets[(key, row_hash)] = f.tell()
+            f.readline()
+    return offsets
+
+def write_incremental(data, output_file, render_lines, fingerprint, code_hash, chunk_size, reuse=True,
+                      validator=None):
+    # Re-render only rows whose prepared features changed since the last build and splice them
+    # between the unchanged lines of the previous output. Any code change re-renders everything.
+    keys = data['PassengerId'].tolist()
+    row_hashes = hash_rows(data)
+
+    manifest = load_manifest(output_file)
+    offsets = {}
+    if reuse and manifest is not None and manifest["code_hash"] == code_hash and manifest["row_keys"] is not None:
+        offsets = _line_offsets(output_file, manifest)
+
+    tmp_file = output_file + '.tmp'
+    n_rendered = 0
+    with JsonlWriter(tmp_file, validator=validator) as writer, \
+            open(output_file if offsets else os.devnull, 'rb') as previous:
+        for start in range(0, len(data), chunk_size):
+            chunk_keys = list(zip(keys[start:start + chunk_size], row_hashes[start:start + chunk_size]))
+            changed = [i for i, key in enumerate(chunk_keys) if key not in offsets]
+            rendered = iter(render_lines(data.iloc[start:start + chunk_size].iloc[changed]) if changed else [])
+            n_rendered += len(changed)
+
+            lines = []
+            for key in chunk_keys:
+                if key in offsets:
+                    previous.seek(offsets[key])
+                    lines.append(previous.readline().decode('utf-8'))
+                else:
+                    lines.append(next(rendered))
+            writer.write_lines(lines)
+    os.replace(tmp_file, output_file)
+
+    save_manifest(output_file, {
+        "fingerprint": fingerprint,
+        "code_hash": code_hash,
+        "row_keys": keys,
+        "row_hashes": row_hashes,
+    })
+    return n_rendered
+
+def write_streaming(chunks, output_file, render_lines, fingerprint, code_hash, validator=None):
+    # Chunked builds render every row and keep no per-row hashes (those grow with the file), so
+    # the next in-memory build renders everything; the fingerprint still lets unchanged builds skip
+    tmp_file = output_file + '.tmp'
+    n_rows = 0
+    with JsonlWriter(tmp_file, validator=validator) as writer:
+        for chunk in chunks:
+            writer.write_lines(render_lines(chunk))
+            n_rows += len(chunk)
+    os.replace(tmp_file, output_file)
+
+    save_manifest(output_file, {
+        "fingerprint": fingerprint,
+        "code_hash": code_hash,
+        "row_keys": None,
+        "row_hashes": None,
+    })
+    return n_rows
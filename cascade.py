@@ -0,0 +1,178 @@
+import argparse
+import asyncio
+import time
+import numpy as np
+import pandas as pd
+from sklearn.linear_model import LogisticRegression
+from config import (TRAIN_FILE, TEST_FILE, SUBMISSION_FILENAME, MODEL_RESPONSES, CASCADE_JOURNAL, MODEL,
+                    MAX_CONCURRENCY, PROMPT_LAYOUT, AGE_LABELS, FARE_LABELS, CASCADE_CONFIDENCE)
+from data_prep import FeaturePipeline, holdout_split
+from generate_llm_based_predictions import journal_record
+from inference import parse_survival_prediction, predict_all
+from journal import PredictionJournal, build_outputs_from_journal
+from prompt_renderer import render_test_entries
+from response_cache import ResponseCache
+from telemetry import Telemetry, print_summary
+
+# Local first stage of a cascade: a logistic regression on the prepared features answers the
+# passengers it is confident about, and only the uncertain band goes to the chat model.
+# FamilySurvivalRate is left out: on training rows it includes the passenger's own label.
+NUMERIC_COLUMNS = ['Pclass', 'Age', 'Fare', 'FamilySize', 'IsAlone', 'NameLength', 'Pclass_Age', 'Sex_Fare']
+CATEGORIES = {
+    'Sex': ['male', 'female'],
+    'Title': ['Mr', 'Mrs', 'Miss', 'Master', 'Rare'],
+    'AgeBin': AGE_LABELS,
+    'FareBin': FARE_LABELS,
+    'Embarked': ['S', 'C', 'Q'],
+    'Deck': ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'T', 'U'],
+}
+
+def cascade_features(data):
+    # Fixed category lists, so train and test rows get the same columns in the same order
+    columns = [data[NUMERIC_COLUMNS].to_numpy(dtype=float)]
+    for name, categories in CATEGORIES.items():
+        values = data[name].to_numpy()
+        columns.append(np.column_stack([values == category for category in categories]).astype(float))
+    return np.nan_to_num(np.hstack(columns))
+
+class LocalClassifier:
+    def __init__(self, confidence=CASCADE_CONFIDENCE):
+        self.confidence = confidence
+        self.model = LogisticRegression(max_iter=1000)
+
+    def fit(self, data):
+        self.model.fit(cascade_features(data), data['Survived'].to_numpy())
+        return self
+
+    def predict_proba(self, data):
+        return self.model.predict_proba(cascade_features(data))[:, 1]
+
+    def route(self, data):
+        # P(survived) per passenger and whether the local answer is confident enough to keep
+        probabilities = self.predict_proba(data)
+        confident = np.maximum(probabilities, 1 - probabilities) >= self.confidence
+        return probabilities, confident
+
+def local_record(passenger_id, probability):
+    return {"PassengerId": int(passenger_id), "ModelResponse": f"Local classifier: P(survived) = {probability:.3f}",
+            "Survived": int(probability >= 0.5), "SurvivalProbability": float(probability), "Error": None}
+
+def run_llm(data, model, concurrency, cache, telemetry=None):
+    if not len(data):
+        return [], 0.0
+    started = time.perf_counter()
+    results = asyncio.run(predict_all(render_test_entries(data, layout=PROMPT_LAYOUT), model=model,
+                                      concurrency=concurrency, cache=cache, telemetry=telemetry))
+    return results, time.perf_counter() - started
+
+def evaluate(model=MODEL, confidence=CASCADE_CONFIDENCE, concurrency=MAX_CONCURRENCY, cache=None, use_llm=True):
+    # Held-out split of the training file: preprocessing and the classifier only see the rest
+    df = pd.read_csv(TRAIN_FILE)
+    train_df, holdout_df = holdout_split(df)
+    pipeline = FeaturePipeline().fit(train_df)
+    classifier = LocalClassifier(confidence).fit(pipeline.transform(train_df, is_train=True))
+
+    holdout = pipeline.transform(holdout_df, is_train=False)
+    labels = holdout_df['Survived'].to_numpy()
+    probabilities, confident = classifier.route(holdout)
+    local_predictions = (probabilities >= 0.5).astype(int)
+
+    report = {
+        "holdout": len(holdout),
+        "confidence": confidence,
+        "routed_to_llm": float(1 - confident.mean()),
+        "local_accuracy_all": float((local_predictions == labels).mean()),
+        "local_accuracy_confident": float((local_predictions[confident] == labels[confident]).mean()) if confident.any() else None,
+    }
+    if not use_llm:
+        return report
+
+    # The LLM answers the uncertain band; the all-LLM baseline is projected from the same calls
+    telemetry = Telemetry(model)
+    results, llm_seconds = run_llm(holdout[~confident], model, concurrency, cache, telemetry)
+    llm_predictions = {r["PassengerId"]: parse_survival_prediction(r["response"].choices[0].message)
+                       for r in results if r["error"] is None}
+    cascade_predictions = local_predictions.copy()
+    for i in np.flatnonzero(~confident):
+        cascade_predictions[i] = llm_predictions.get(int(holdout['PassengerId'].iloc[i])) or 0
+    uncertain = ~confident
+
+    summary = telemetry.summary()
+    n_calls = int(uncertain.sum())
+    report.update({
+        "llm_accuracy_uncertain": float((cascade_predictions[uncertain] == labels[uncertain]).mean()) if n_calls else None,
+        "local_accuracy_uncertain": float((local_predictions[uncertain] == labels[uncertain]).mean()) if n_calls else None,
+        "cascade_accuracy": float((cascade_predictions == labels).mean()),
+        "llm_calls": n_calls,
+        "llm_seconds": llm_seconds,
+        "all_llm_seconds_projected": llm_seconds / n_calls * len(holdout) if n_calls else None,
+        "llm_cost": summary["estimated_cost_usd"],
+        "all_llm_cost_projected": summary["estimated_cost_usd"] / n_calls * len(holdout)
+        if n_calls and summary["estimated_cost_usd"] is not None else None,
+    })
+    return report
+
+def print_report(report):
+    print(f"Held-out passengers: {report['holdout']}, confidence threshold {report['confidence']}")
+    print(f"Routed to the LLM: {report['routed_to_llm']:.1%}")
+    confident_accuracy = (f"{report['local_accuracy_confident']:.1%}"
+                          if report["local_accuracy_confident"] is not None else "n/a")
+    print(f"Local classifier accuracy: {report['local_accuracy_all']:.1%} overall, "
+          f"{confident_accuracy} on the passengers it answers")
+    if "cascade_accuracy" not in report:
+        return
+    if report["llm_calls"]:
+        print(f"Uncertain band: LLM {report['llm_accuracy_uncertain']:.1%} vs local {report['local_accuracy_uncertain']:.1%}")
+        print(f"LLM time {report['llm_seconds']:.1f}s vs ~{report['all_llm_seconds_projected']:.1f}s for every passenger")
+        if report["llm_cost"] is not None:
+            print(f"LLM cost ${report['llm_cost']:.4f} vs ~${report['all_llm_cost_projected']:.4f} for every passenger")
+    print(f"Cascade accuracy: {report['cascade_accuracy']:.1%}")
+
+def predict_test(model=MODEL, confidence=CASCADE_CONFIDENCE, concurrency=MAX_CONCURRENCY, cache=None,
+                 journal_path=CASCADE_JOURNAL):
+    # Confident passengers are journaled straight away; the rest go through the normal LLM path
+    train_df = pd.read_csv(TRAIN_FILE)
+    pipeline = FeaturePipeline().fit(train_df)
+    classifier = LocalClassifier(confidence).fit(pipeline.transform(train_df, is_train=True))
+    test = pipeline.transform(pd.read_csv(TEST_FILE), is_train=False)
+    probabilities, confident = classifier.route(test)
+
+    journal = PredictionJournal(journal_path)
+    telemetry = Telemetry(model)
+    try:
+        for passenger_id, probability in zip(test['PassengerId'][confident], probabilities[confident]):
+            journal.append(local_record(passenger_id, probability))
+        print(f"{confident.sum()} passengers answered locally, {(~confident).sum()} sent to {model}")
+        if (~confident).any():
+            asyncio.run(predict_all(
+                render_test_entries(test[~confident], layout=PROMPT_LAYOUT), model=model, concurrency=concurrency,
+                cache=cache, telemetry=telemetry, on_result=lambda result: journal.append(journal_record(result))
+            ))
+    finally:
+        journal.close()
+        print_summary(telemetry.summary())
+    build_outputs_from_journal(journal_path, SUBMISSION_FILENAME, MODEL_RESPONSES)
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer confident passengers locally and send the rest to the chat model")
+    parser.add_argument('command', choices=['evaluate', 'predict'])
+    parser.add_argument('--model', default=MODEL)
+    parser.add_argument('--confidence', type=float, default=CASCADE_CONFIDENCE,
+                        help="keep the local answer when max(p, 1 - p) is at least this")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY)
+    parser.add_argument('--no-cache', action='store_true',
+                        help="bypass the on-disk response cache and always call the API")
+    parser.add_argument('--no-llm', action='store_true', help="evaluate: report routing and local accuracy only")
+    args = parser.parse_args()
+
+    cache = ResponseCache(enabled=not args.no_cache)
+    try:
+        if args.command == 'evaluate':
+            print_report(evaluate(args.model, args.confidence, args.concurrency, cache, use_llm=not args.no_llm))
+        else:
+            predict_test(args.model, args.confidence, args.concurrency, cache)
+    finally:
+        cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import argparse
+import importlib
+import sys
+
+# One entry point for the pipeline scripts: `python cli.py <command> [options]`. Each command runs
+# the main() of the module named here, imported only once the command is chosen, so pandas,
+# sklearn, tiktoken and openai are loaded by the commands that use them and not by the others.
+COMMANDS = {
+    "build": ("main", "prepare train/test data and write the fine-tuning JSONL files"),
+    "balance": ("balance_train_dataset_oversample", "oversample the training set"),
+    "validate": ("utils.format_validation", "check a JSONL file for format errors"),
+    "estimate": ("utils.cost_estimation", "count tokens and estimate fine-tuning cost"),
+    "finetune": ("fine_tune", "upload the training file and start or follow a fine-tuning job"),
+    "predict": ("generate_llm_based_predictions", "predict the test set with a chat model"),
+    "inspect": ("test_prediction", "print model responses for the first few test passengers"),
+    "batch": ("batch_predict", "predict the test set through the Batch API"),
+    "ensemble": ("ensemble", "majority-vote predictions from several models or seeds"),
+    "cascade": ("cascade", "answer confident passengers locally, the rest with the chat model"),
+    "compact": ("compact_dataset", "build compact datasets or export them to JSONL"),
+    "compare": ("compare_inference_modes", "compare reasoning and label inference modes"),
+    "eval": ("eval_prompts", "score prompt variants x models on held-out training passengers"),
+    "benchmark": ("benchmark", "time every pipeline stage on synthetic data"),
+    "serve": ("predict_service", "serve single-passenger predictions over HTTP"),
+    "mock-server": ("mock_server", "serve a local mock of the OpenAI endpoints the pipeline uses"),
+    "loadtest": ("load_test", "push the prediction request path at a target rate"),
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cli.py", description="Titanic LLM pipeline")
+    subparsers = parser.add_subparsers(dest='command', required=True, metavar='command')
+    for name, (_, help) in COMMANDS.items():
+        # Options are parsed by the command itself, including --help
+        subparsers.add_parser(name, help=help, add_help=False)
+    args, rest = parser.parse_known_args(argv)
+
+    module = importlib.import_module(COMMANDS[args.command][0])
+    sys.argv = [f"cli.py {args.command}", *rest]
+    return module.main()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from build_manifest import hash_file, hash_values, CODE_DIR
+from config import TRAIN_FILE, TEST_FILE, PROMPT_LAYOUT, TRAIN_COMPACT, TEST_COMPACT
+from data_prep import FeaturePipeline, prepare_data
+from prompt_renderer import render_train_lines, render_test_lines
+from utils.format_validation import FormatValidator
+from utils.jsonl_io import JsonlWriter, loads
+
+# pyarrow is optional; only the compact format needs it
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Compact datasets keep the prompt template out of the file: each row holds only the prepared
+# fields the renderer reads, and the messages are rendered from them when iterated. The template
+# version (a hash of the prompt code plus the layout) is stored once, so a file is only read back
+# with the code that produces the same text.
+FORMAT_VERSION = 1
+TEMPLATE_FILES = ['prompts.py', 'prompt_renderer.py']
+PROMPT_FIELDS = ['PassengerId', 'Title', 'LastName', 'Age', 'Age_Original', 'Fare', 'Fare_Original', 'Sex',
+                 'Pclass', 'FamilySize', 'AgeBin', 'Embarked', 'FareBin', 'Cabin', 'Survived']
+BATCH_SIZE = 10000  # rows per Arrow record batch, and per rendering chunk when iterating
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Compact datasets need pyarrow: pip install pyarrow")
+
+def template_version(layout):
+    return hash_values([hash_file(os.path.join(CODE_DIR, name)) for name in TEMPLATE_FILES], layout)
+
+def write_compact(data, path, is_train=True, layout=PROMPT_LAYOUT, batch_size=BATCH_SIZE):
+    # Arrow IPC file, uncompressed so the reader can memory-map it without copying
+    require_pyarrow()
+    table = pa.Table.from_pandas(data[PROMPT_FIELDS], preserve_index=False)
+    table = table.replace_schema_metadata({
+        "format_version": str(FORMAT_VERSION),
+        "template_version": template_version(layout),
+        "layout": layout,
+        "is_train": str(is_train),
+    })
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with pa.OSFile(path + '.tmp', 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        for batch in table.to_batches(max_chunksize=batch_size):
+            writer.write_batch(batch)
+    os.replace(path + '.tmp', path)
+    return table.num_rows
+
+class CompactDataset:
+    # Memory-mapped reader. Fields are available column-wise without copying; chat messages are
+    # rendered one record batch at a time, so iterating never holds more than one batch of text.
+    def __init__(self, path, check_template=True):
+        require_pyarrow()
+        self.path = path
+        self.source = pa.memory_map(path, 'r')
+        self.reader = pa.ipc.open_file(self.source)
+        metadata = {k.decode(): v.decode() for k, v in (self.reader.schema.metadata or {}).items()}
+        if int(metadata.get("format_version", 0)) != FORMAT_VERSION:
+            raise ValueError(f"{path} has compact format version {metadata.get('format_version')}, "
+                             f"expected {FORMAT_VERSION}")
+        self.layout = metadata["layout"]
+        self.is_train = metadata["is_train"] == "True"
+        if check_template and metadata["template_version"] != template_version(self.layout):
+            raise ValueError(f"{path} was written with a different prompt template; rebuild it "
+                             f"or export it with the code version that wrote it")
+
+    def __len__(self):
+        return sum(self.reader.get_batch(i).num_rows for i in range(self.reader.num_record_batches))
+
+    def column(self, name):
+        # Zero-copy for numeric columns
+        return self.reader.read_all().column(name)
+
+    def iter_frames(self):
+        for i in range(self.reader.num_record_batches):
+            frame = self.reader.get_batch(i).to_pandas()
+            # Arrow nulls come back as None; the renderer expects pandas' NaN as in the prepared data
+            for name in frame.columns[frame.dtypes == object]:
+                frame[name] = frame[name].where(frame[name].notna(), np.nan)
+            yield frame
+
+    def iter_lines(self):
+        # JSONL lines identical to the ones create_train_jsonl / create_test_jsonl write
+        render_lines = render_train_lines if self.is_train else render_test_lines
+        for frame in self.iter_frames():
+            yield from render_lines(frame, layout=self.layout)
+
+    def __iter__(self):
+        for line in self.iter_lines():
+            yield loads(line)
+
+    def close(self):
+        self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def export_jsonl(path, output_file):
+    # Plain JSONL for uploads, validated as it is written
+    with CompactDataset(path) as dataset, \
+            JsonlWriter(output_file, validator=FormatValidator(require_assistant=dataset.is_train,
+                                                               fail_fast=True)) as writer:
+        writer.write_lines(dataset.iter_lines())
+        return writer.n_records
+
+def main():
+    parser = argparse.ArgumentParser(description="Build compact datasets or export them to JSONL")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('build', help="prepare TRAIN_FILE/TEST_FILE and write TRAIN_COMPACT/TEST_COMPACT")
+    export = subparsers.add_parser('export', help="write a compact dataset as plain JSONL")
+    export.add_argument('path')
+    export.add_argument('output')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        pipeline = FeaturePipeline().fit(pd.read_csv(TRAIN_FILE))
+        for input_file, output_file, is_train in [(TRAIN_FILE, TRAIN_COMPACT, True), (TEST_FILE, TEST_COMPACT, False)]:
+            data = prepare_data(input_file, is_train=is_train, pipeline=pipeline)
+            n_rows = write_compact(data, output_file, is_train=is_train)
+            print(f"{n_rows} rows saved to {output_file} ({os.path.getsize(output_file)} bytes)")
+    else:
+        n_records = export_jsonl(args.path, args.output)
+        print(f"{n_records} records exported to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import pandas as pd
+from config import TRAIN_FILE, MODEL, MAX_CONCURRENCY, PROMPT_LAYOUT, SURVIVAL_THRESHOLD
+from data_prep import FeaturePipeline
+from inference import (INFERENCE_MODES, LABEL_PARAMS, parse_label_prediction, parse_survival_prediction,
+                       predict_all, to_label_messages)
+from prompt_renderer import render_test_entries
+from response_cache import ResponseCache
+from utils.stats import percentile
+
+# Labeled passengers from the training set, prompted exactly like test passengers (no survival hints).
+# With a model fine-tuned on TRAIN_FILE the accuracies are optimistic, but the comparison stays fair.
+SAMPLE_SIZE = 100
+
+def labeled_entries(file_path=TRAIN_FILE, n=SAMPLE_SIZE, layout=PROMPT_LAYOUT, seed=42):
+    df = pd.read_csv(file_path)
+    data = FeaturePipeline().fit(df).transform(df.sample(n=min(n, len(df)), random_state=seed), is_train=False)
+    labels = dict(zip(df['PassengerId'], df['Survived']))
+    return render_test_entries(data, layout=layout), labels
+
+def run_mode(entries, labels, mode, model, concurrency, cache, threshold=SURVIVAL_THRESHOLD):
+    if mode == "label":
+        entries = [{**entry, "messages": to_label_messages(entry["messages"])} for entry in entries]
+    params = LABEL_PARAMS if mode == "label" else {}
+    results = asyncio.run(predict_all(entries, model=model, concurrency=concurrency, cache=cache, **params))
+
+    latencies, output_tokens, correct, unclear, errors = [], 0, 0, 0, 0
+    for result in results:
+        if result["error"] is not None:
+            errors += 1
+            continue
+        response = result["response"]
+        latencies.append(result["latency"])
+        if response.usage is not None:
+            output_tokens += response.usage.completion_tokens
+        if mode == "label":
+            survived, _ = parse_label_prediction(response, threshold)
+        else:
+            survived = parse_survival_prediction(response.choices[0].message)
+        if survived is None:
+            unclear += 1
+            survived = 0  # same default as the submission
+        correct += survived == labels[result["PassengerId"]]
+
+    answered = len(latencies)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "unclear": unclear,
+        "accuracy": correct / answered if answered else None,
+        "latency_mean": sum(latencies) / answered if answered else None,
+        "latency_p50": percentile(latencies, 50) if answered else None,
+        "latency_p95": percentile(latencies, 95) if answered else None,
+        "output_tokens_per_request": output_tokens / answered if answered else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare reasoning and label inference modes on labeled passengers")
+    parser.add_argument('--model', default=MODEL)
+    parser.add_argument('--sample-size', type=int, default=SAMPLE_SIZE)
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY)
+    parser.add_argument('--threshold', type=float, default=SURVIVAL_THRESHOLD)
+    parser.add_argument('--no-cache', action='store_true',
+                        help="bypass the on-disk response cache (cached responses report near-zero latency)")
+    args = parser.parse_args()
+
+    entries, labels = labeled_entries(n=args.sample_size)
+    cache = ResponseCache(enabled=not args.no_cache)
+    try:
+        report = {mode: run_mode(entries, labels, mode, args.model, args.concurrency, cache, args.threshold)
+                  for mode in INFERENCE_MODES}
+    finally:
+        cache.close()
+
+    print(f"{len(entries)} passengers from {TRAIN_FILE} with {args.model}:")
+    print(f"{'mode':>10} {'accuracy':>9} {'unclear':>8} {'errors':>7} {'mean s':>7} {'p50 s':>7} {'p95 s':>7} {'out tok':>8}")
+    for mode, stats in report.items():
+        if stats["accuracy"] is None:
+            print(f"{mode:>10} every request failed")
+            continue
+        print(f"{mode:>10} {stats['accuracy']:>9.1%} {stats['unclear']:>8} {stats['errors']:>7} "
+              f"{stats['latency_mean']:>7.2f} {stats['latency_p50']:>7.2f} {stats['latency_p95']:>7.2f} "
+              f"{stats['output_tokens_per_request']:>8.1f}")
+    return report
+
+if __name__ == "__main__":
+    main()
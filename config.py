@@ -6,14 +6,30 @@ TRAIN_FILE = os.path.join(BASE_DIR, 'train/train.csv')
 TEST_FILE = os.path.join(BASE_DIR, 'test/test.csv')
 TRAIN_OUTPUT = os.path.join(BASE_DIR, 'train/jsonl/claude_train_v2.jsonl')
 TEST_OUTPUT = os.path.join(BASE_DIR, 'test/jsonl/claude_test_v2.jsonl')
+TRAIN_COMPACT = os.path.join(BASE_DIR, 'train/compact/claude_train_v2.arrow')  # fields + template version
+TEST_COMPACT = os.path.join(BASE_DIR, 'test/compact/claude_test_v2.arrow')
+PIPELINE_STATE = os.path.join(BASE_DIR, 'train/feature_pipeline.json')  # preprocessing fitted on TRAIN_FILE
 SUBMISSION_FILENAME =  os.path.join(BASE_DIR,"submissions/submission_baseline.csv")
 MODEL_RESPONSES = os.path.join(BASE_DIR, 'test/model_responses_baseline.json')
+PREDICTION_JOURNAL = os.path.join(BASE_DIR, 'test/prediction_journal.jsonl')
+BATCH_INPUT = os.path.join(BASE_DIR, 'test/batch_input.jsonl')
+UPLOAD_MANIFEST = os.path.join(BASE_DIR, 'train/uploaded_files.json')  # training file sha256 -> OpenAI file id
+BENCHMARK_RESULTS = os.path.join(BASE_DIR, 'benchmarks/results.jsonl')  # one JSON record per benchmark run
+EVAL_RESULTS = os.path.join(BASE_DIR, 'eval/prompt_variants.jsonl')  # one JSON record per prompt evaluation
 
 # Data preparation parameters
 AGE_BINS = [0, 12, 18, 65, float('inf')]
 AGE_LABELS = ['Child', 'Teenager', 'Adult', 'Elderly']
 FARE_BINS = 4
 FARE_LABELS = ['Low', 'Medium-Low', 'Medium-High', 'High']
+HOLDOUT_FRACTION = 0.2  # stratified slice of TRAIN_FILE held out for local evaluation
+
+# Training set balancing: 'historical' (survival factors) or 'sex_pclass' (stratified)
+BALANCE_STRATEGY = 'historical'
+BALANCED_TRAIN = os.path.join(BASE_DIR, 'train/balanced_train.csv')
+
+# Prompt layout: 'classic', 'prefix' (invariant text first, cache-friendly) or 'compact'
+PROMPT_LAYOUT = 'classic'
 
 
 # Feature importance (for analytical breakdown)
@@ -26,4 +42,43 @@ FEATURE_IMPORTANCE = {
     'FamilySize': 'Moderate',
     'Title': 'High',
     'Deck': 'Moderate'
-}
\ No newline at end of file
+}
+
+# Inference
+MODEL = "gpt-4o-mini-2024-07-18"  # baseline model
+# MODEL = "ft:gpt-4o-mini-2024-07-18:personal::A0wPhdQr"  # claude v2
+MAX_CONCURRENCY = 16  # simultaneous in-flight chat completion requests
+MAX_RETRIES = 5  # per-request retries on rate limits, timeouts and 5xx errors
+RATE_LIMIT_RPM = 500  # org limits to start from; the x-ratelimit-limit-* headers replace them
+RATE_LIMIT_TPM = 200000
+MAX_THROTTLED_SECONDS = 600  # with a rate limiter, give up on a request still throttled after this long
+INFERENCE_MODE = 'reasoning'  # 'reasoning' (free-text answer) or 'label' (single token with logprobs)
+SURVIVAL_THRESHOLD = 0.5  # label mode: predict survival when P(survived) >= threshold
+
+# Ensemble: members are model ids, optionally with a sampling seed as "model@seed"
+ENSEMBLE_MEMBERS = [
+    "gpt-4o-mini-2024-07-18@1",
+    "gpt-4o-mini-2024-07-18@2",
+    "gpt-4o-mini-2024-07-18@3",
+    # "ft:gpt-4o-mini-2024-07-18:personal::A0wPhdQr",  # claude v2
+]
+ENSEMBLE_TEMPERATURE = 0.7  # sampling temperature for seeded members
+ENSEMBLE_JOURNAL = os.path.join(BASE_DIR, 'test/ensemble_journal.jsonl')
+
+# Cascade: a local classifier answers passengers it is confident about, the rest go to MODEL
+CASCADE_CONFIDENCE = 0.85  # keep the local answer when max(p, 1 - p) is at least this
+CASCADE_JOURNAL = os.path.join(BASE_DIR, 'test/cascade_journal.jsonl')
+
+# Online prediction service (predict_service.py)
+SERVICE_PORT = 8000
+SERVICE_LRU_SIZE = 10000  # responses kept in memory, keyed by prompt
+SERVICE_TIMEOUT_SECONDS = 120  # a /predict request still waiting for the model after this gets a 504
+
+# Telemetry: per-run summary JSON and a Prometheus textfile (llm_predictions.prom)
+TELEMETRY_DIR = os.path.join(BASE_DIR, 'telemetry')
+TELEMETRY_SNAPSHOT_SECONDS = 30  # interval for live snapshots when enabled
+
+# Response cache
+RESPONSE_CACHE = os.path.join(BASE_DIR, 'cache/responses.sqlite')
+CACHE_MAX_SIZE_MB = 512  # least recently used responses are evicted beyond this
+CACHE_MAX_AGE_DAYS = 30
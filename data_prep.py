@@ -1,59 +1,368 @@
+import json
+import os
+import warnings
+from collections import Counter, defaultdict
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
 from config import *
 
-def prepare_data(file_path, is_train=True):
-    df = pd.read_csv(file_path)
-    
+TITLE_MAPPING = {
+    **{title: 'Rare' for title in ['Lady', 'Countess', 'Capt', 'Col', 'Don', 'Dr', 'Major', 'Rev', 'Sir', 'Jonkheer', 'Dona']},
+    'Mlle': 'Miss', 'Ms': 'Miss', 'Mme': 'Mrs'
+}
+NUMERICAL_FEATURES = ['Age', 'Fare', 'FamilySize', 'NameLength', 'Pclass_Age', 'Sex_Fare']
+SEX_CODES = {'male': 0, 'female': 1}
+CSV_CHUNK_SIZE = 100000  # rows per chunk when fitting/transforming files that do not fit in memory
+SKETCH_CAPACITY = 100000  # distinct values a quantile sketch keeps exactly before it starts merging
+
+def add_base_features(df, title_mapping=TITLE_MAPPING):
+    # Features that only depend on the passenger's own row
     # Extract LastName
     df['LastName'] = df['Name'].str.split(',').str[0]
-    
+
     # Feature engineering
-    df['Title'] = df['Name'].str.extract(' ([A-Za-z]+)\.', expand=False)
-    df['Title'] = df['Title'].replace(['Lady', 'Countess','Capt', 'Col','Don', 'Dr', 'Major', 'Rev', 'Sir', 'Jonkheer', 'Dona'], 'Rare')
-    df['Title'] = df['Title'].replace(['Mlle', 'Ms', 'Mme'], ['Miss', 'Miss', 'Mrs'])
-    
+    df['Title'] = df['Name'].str.extract(r' ([A-Za-z]+)\.', expand=False)
+    df['Title'] = df['Title'].replace(title_mapping)
+
     df['FamilySize'] = df['SibSp'] + df['Parch'] + 1
     df['IsAlone'] = (df['FamilySize'] == 1).astype(int)
     df['Deck'] = df['Cabin'].str[0].fillna('U')
-    df['NameLength'] = df['Name'].apply(len)
-    
-    # Handle missing data
-    df['Age'] = df.groupby(['Title', 'Pclass'])['Age'].transform(lambda x: x.fillna(x.median()))
-    df['Fare'] = df.groupby('Pclass')['Fare'].transform(lambda x: x.fillna(x.median()))
-    df['Embarked'] = df['Embarked'].fillna(df['Embarked'].mode()[0])
-    
-    # Create FareBin as a categorical type
-    df['FareBin'] = pd.qcut(df['Fare'], FARE_BINS, labels=FARE_LABELS).astype(str)
-    
-    df['AgeBin'] = pd.cut(df['Age'], bins=AGE_BINS, labels=AGE_LABELS).astype(str)
-    
-    # Store original values before scaling
-    df['Age_Original'] = df['Age']
-    df['Fare_Original'] = df['Fare']
-    
-    # Interaction features
-    df['Pclass_Age'] = df['Pclass'] * df['Age']
-    df['Sex_Fare'] = df['Sex'].map({'male': 0, 'female': 1}) * df['Fare']
-    
-    # Social status feature
-    df['SocialStatus'] = df['Pclass'].astype(str) + '_' + df['Title']
-    
-    # Normalize numerical features
-    scaler = StandardScaler()
-    numerical_features = ['Age', 'Fare', 'FamilySize', 'NameLength', 'Pclass_Age', 'Sex_Fare']
-    df[numerical_features] = scaler.fit_transform(df[numerical_features])
-    
-    if is_train:
-        # Create family survival rate feature for training data
-        df['FamilySurvivalRate'] = df.groupby('LastName')['Survived'].transform('mean')
-    else:
-        # For test data, we'll use a placeholder value
-        df['FamilySurvivalRate'] = -1
-    
-    if not is_train:
-        # For test data, we'll use a placeholder value for Survived
-        df['Survived'] = -1
-
-    return df
\ No newline at end of file
+    df['NameLength'] = df['Name'].str.len()
+    return df
+
+class QuantileSketch:
+    # Weighted value counts. Quantiles are exact (same interpolation as pandas) while there are at
+    # most `capacity` distinct values; beyond that, neighbouring values are merged into their
+    # weighted mean, so memory stays bounded and inner quantiles become approximate. The minimum
+    # and maximum are always exact.
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64')
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add_counts(self, counts):
+        # counts: Series of value -> number of occurrences
+        if counts.empty:
+            return
+        self.counts = self.counts.add(counts, fill_value=0).astype('int64')
+        self.min = min(self.min, counts.index.min())
+        self.max = max(self.max, counts.index.max())
+        if len(self.counts) > self.capacity:
+            self._compress()
+
+    def add_series(self, series):
+        self.add_counts(series.dropna().value_counts(sort=False))
+
+    def _compress(self):
+        values = self.counts.index.to_numpy(dtype=float)
+        counts = self.counts.to_numpy()
+        groups = np.arange(len(values)) * (self.capacity // 2) // len(values)
+        weights = np.bincount(groups, weights=counts)
+        centroids = np.bincount(groups, weights=values * counts) / weights
+        self.counts = pd.Series(weights.astype('int64'), index=centroids)
+
+    def _values_at(self, ranks):
+        # Value at each 0-based rank of the sorted data
+        cumulative = self.counts.to_numpy().cumsum()
+        return self.counts.index[np.searchsorted(cumulative, np.asarray(ranks) + 1)].tolist()
+
+    @property
+    def n(self):
+        return int(self.counts.sum())
+
+    def quantile(self, q):
+        if q == 0:
+            return self.min
+        if q == 1:
+            return self.max
+        position = q * (self.n - 1)
+        lo, hi = self._values_at([int(np.floor(position)), int(np.ceil(position))])
+        # numpy's linear interpolation, which pandas quantile/qcut use
+        t = position - np.floor(position)
+        return lo + (hi - lo) * t if t < 0.5 else hi - (hi - lo) * (1 - t)
+
+    def median(self):
+        if self.counts.empty:
+            return np.nan
+        lo, hi = self._values_at([(self.n - 1) // 2, self.n // 2])
+        return (lo + hi) / 2  # pandas groupby median averages the two middle values
+
+class RunningMoments:
+    # Per-feature count/mean/M2, merged chunk by chunk (Chan et al.); NaNs are skipped like StandardScaler
+    def __init__(self, n_features):
+        self.n = np.zeros(n_features)
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+
+    def merge(self, n, mean, m2):
+        total = self.n + n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * n / total, 0.0)
+            self.m2 = np.where(total > 0, self.m2 + m2 + delta ** 2 * self.n * n / total, 0.0)
+        self.n = total
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        n = (~np.isnan(values)).sum(axis=0)
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN columns
+            mean = np.nan_to_num(np.nanmean(values, axis=0))
+            m2 = np.nan_to_num(np.nansum((values - mean) ** 2, axis=0))
+        self.merge(n, mean, m2)
+
+    def add_constant(self, feature, value, count):
+        # `count` copies of one value, e.g. the median filled into missing rows
+        if count and not np.isnan(value):
+            n, mean, m2 = np.zeros_like(self.n), np.zeros_like(self.mean), np.zeros_like(self.m2)
+            n[feature], mean[feature] = count, value
+            self.merge(n, mean, m2)
+
+    def scale(self):
+        scale = np.sqrt(self.m2 / np.maximum(self.n, 1))
+        return np.where(scale == 0, 1.0, scale)  # StandardScaler leaves constant features unscaled
+
+class FeaturePipeline:
+    # Fitted once on the training passengers; transform() only does lookups and vectorized
+    # arithmetic, so its cost depends on the batch size and not on the training set size.
+    def __init__(self):
+        self.title_mapping = dict(TITLE_MAPPING)
+        self.age_medians = None       # Series indexed by (Title, Pclass)
+        self.title_age_medians = None # Series indexed by Title, for pairs without a median
+        self.age_median = None        # for titles without one either
+        self.fare_medians = None      # Series indexed by Pclass
+        self.embarked_mode = None
+        self.fare_edges = None        # qcut bin edges of the training fares
+        self.scaler_mean = None
+        self.scaler_scale = None
+        self.family_survival = None   # Series indexed by LastName
+
+    def fit(self, df):
+        df = add_base_features(df.copy(), self.title_mapping)
+
+        self.age_medians = df.groupby(['Title', 'Pclass'])['Age'].median()
+        self.title_age_medians = df.groupby('Title')['Age'].median()
+        self.age_median = float(df['Age'].median())
+        self.fare_medians = df.groupby('Pclass')['Fare'].median()
+        self.embarked_mode = df['Embarked'].mode()[0]
+        self._fill_missing(df)
+
+        _, edges = pd.qcut(df['Fare'], FARE_BINS, labels=FARE_LABELS, retbins=True)
+        self.fare_edges = [float(edge) for edge in edges]
+
+        self._add_interactions(df)
+        # Lazy import: sklearn takes over a second to import and transforming with a saved state doesn't need it
+        from sklearn.preprocessing import StandardScaler
+        scaler = StandardScaler().fit(df[NUMERICAL_FEATURES])
+        self.scaler_mean = scaler.mean_.astype(float)
+        self.scaler_scale = scaler.scale_.astype(float)
+
+        if 'Survived' in df:
+            self.family_survival = df.groupby('LastName')['Survived'].mean()
+        return self
+
+    def transform(self, df, is_train=True):
+        df = add_base_features(df.copy(), self.title_mapping)
+
+        # Handle missing data
+        self._fill_missing(df)
+
+        # Bin fares with the training edges; the open outer edges also cover fares outside the training range
+        edges = [-np.inf] + self.fare_edges[1:-1] + [np.inf]
+        df['FareBin'] = pd.cut(df['Fare'], bins=edges, labels=FARE_LABELS, include_lowest=True).astype(str)
+
+        df['AgeBin'] = pd.cut(df['Age'], bins=AGE_BINS, labels=AGE_LABELS).astype(str)
+
+        # Store original values before scaling
+        df['Age_Original'] = df['Age']
+        df['Fare_Original'] = df['Fare']
+
+        self._add_interactions(df)
+
+        # Normalize numerical features
+        values = df[NUMERICAL_FEATURES].to_numpy(dtype=float)
+        values -= self.scaler_mean
+        values /= self.scaler_scale
+        df[NUMERICAL_FEATURES] = values
+
+        if is_train:
+            # Family survival rate seen in training; names unseen there get the test placeholder
+            df['FamilySurvivalRate'] = self.family_survival.reindex(df['LastName']).fillna(-1).to_numpy()
+        else:
+            # For test data, we'll use a placeholder value
+            df['FamilySurvivalRate'] = -1
+
+        if not is_train:
+            # For test data, we'll use a placeholder value for Survived
+            df['Survived'] = -1
+
+        return df
+
+    def fit_chunks(self, chunks, sketch_capacity=SKETCH_CAPACITY):
+        # Same statistics as fit(), accumulated over an iterable of DataFrame chunks (one pass), so
+        # memory is bounded by the chunk size. Missing ages/fares are filled with medians that are only
+        # known at the end; since every filled row of a group gets the same value, their contribution
+        # to the fare quantiles and the scaler moments is added afterwards from per-group counts.
+        age_sketches = defaultdict(lambda: QuantileSketch(sketch_capacity))     # (Title, Pclass)
+        title_age_sketches = defaultdict(lambda: QuantileSketch(sketch_capacity))  # Title
+        all_ages = QuantileSketch(sketch_capacity)
+        fare_sketches = defaultdict(lambda: QuantileSketch(sketch_capacity))    # Pclass
+        all_fares = QuantileSketch(sketch_capacity)
+        missing_ages = Counter()    # (Title, Pclass) -> rows with a missing age
+        missing_fares = Counter()   # (Pclass, sex code) -> rows with a missing fare
+        embarked = Counter()
+        moments = RunningMoments(len(NUMERICAL_FEATURES))
+        family = None  # per LastName: survivors and passengers; one row per surname
+
+        for df in chunks:
+            df = add_base_features(df.copy(), self.title_mapping)
+            for key, ages in df.groupby(['Title', 'Pclass'])['Age']:
+                age_sketches[key].add_series(ages)
+            for title, ages in df.groupby('Title')['Age']:
+                title_age_sketches[title].add_series(ages)
+            all_ages.add_series(df['Age'])
+            for pclass, fares in df.groupby('Pclass')['Fare']:
+                fare_sketches[pclass].add_series(fares)
+            all_fares.add_series(df['Fare'])
+
+            missing = df[df['Age'].isna() & df['Title'].notna()]
+            missing_ages.update(zip(missing['Title'], missing['Pclass']))
+            missing = df[df['Fare'].isna()]
+            missing_fares.update(zip(missing['Pclass'], missing['Sex'].map(SEX_CODES)))
+            embarked.update(df['Embarked'].dropna())
+
+            # Rows with a missing age/fare contribute NaN here and are added from the counts below
+            self._add_interactions(df)
+            moments.add(df[NUMERICAL_FEATURES])
+
+            if 'Survived' in df:
+                counts = df.groupby('LastName')['Survived'].agg(['sum', 'count'])
+                family = counts if family is None else family.add(counts, fill_value=0)
+
+        age_keys = sorted(age_sketches)
+        self.age_medians = pd.Series([age_sketches[key].median() for key in age_keys],
+                                     index=pd.MultiIndex.from_tuples(age_keys, names=['Title', 'Pclass']), dtype=float)
+        self.title_age_medians = pd.Series({title: title_age_sketches[title].median()
+                                            for title in sorted(title_age_sketches)}, dtype=float)
+        self.age_median = float(all_ages.median())
+        self.fare_medians = pd.Series({pclass: fare_sketches[pclass].median() for pclass in sorted(fare_sketches)},
+                                      dtype=float)
+        # Most frequent port, ties broken alphabetically like Series.mode()
+        self.embarked_mode = min(embarked, key=lambda port: (-embarked[port], port))
+
+        age, fare, pclass_age, sex_fare = (NUMERICAL_FEATURES.index(name) for name in ['Age', 'Fare', 'Pclass_Age', 'Sex_Fare'])
+        for (title, pclass), count in missing_ages.items():
+            median = self._age_fill_values([title], [pclass])[0]
+            moments.add_constant(age, median, count)
+            moments.add_constant(pclass_age, pclass * median, count)
+        for (pclass, sex_code), count in missing_fares.items():
+            median = self.fare_medians.get(pclass, np.nan)
+            if not np.isnan(median):
+                all_fares.add_counts(pd.Series([count], index=[median]))
+            moments.add_constant(fare, median, count)
+            moments.add_constant(sex_fare, sex_code * median, count)
+
+        self.fare_edges = [float(all_fares.quantile(q)) for q in np.linspace(0, 1, FARE_BINS + 1)]
+        self.scaler_mean = moments.mean.astype(float)
+        self.scaler_scale = moments.scale().astype(float)
+        if family is not None:
+            family = family.sort_index()
+            self.family_survival = (family['sum'] / family['count']).rename_axis('LastName').rename('Survived')
+        return self
+
+    def transform_chunks(self, chunks, is_train=True):
+        for df in chunks:
+            yield self.transform(df, is_train)
+
+    def fit_transform(self, df, is_train=True):
+        return self.fit(df).transform(df, is_train)
+
+    def _age_fill_values(self, titles, pclasses):
+        # Median age of the (Title, Pclass) pair, else of the Title, else of every passenger
+        by_pair = self.age_medians.reindex(pd.MultiIndex.from_arrays([titles, pclasses])).to_numpy()
+        by_title = self.title_age_medians.reindex(titles).to_numpy()
+        return np.where(np.isnan(by_pair), np.where(np.isnan(by_title), self.age_median, by_title), by_pair)
+
+    def _fill_missing(self, df):
+        # Per-(Title, Pclass) age and per-class fare medians, looked up rather than recomputed
+        df['Age'] = df['Age'].fillna(pd.Series(self._age_fill_values(df['Title'], df['Pclass']), index=df.index))
+        df['Fare'] = df['Fare'].fillna(pd.Series(self.fare_medians.reindex(df['Pclass']).to_numpy(), index=df.index))
+        df['Embarked'] = df['Embarked'].fillna(self.embarked_mode)
+
+    def _add_interactions(self, df):
+        # Interaction features
+        df['Pclass_Age'] = df['Pclass'] * df['Age']
+        df['Sex_Fare'] = df['Sex'].map(SEX_CODES) * df['Fare']
+
+        # Social status feature
+        df['SocialStatus'] = df['Pclass'].astype(str) + '_' + df['Title']
+
+    def save(self, path):
+        state = {
+            "title_mapping": self.title_mapping,
+            "age_medians": [[title, int(pclass), median] for (title, pclass), median in self.age_medians.items()],
+            "title_age_medians": self.title_age_medians.to_dict(),
+            "age_median": self.age_median,
+            "fare_medians": {str(pclass): median for pclass, median in self.fare_medians.items()},
+            "embarked_mode": self.embarked_mode,
+            "fare_edges": self.fare_edges,
+            "numerical_features": NUMERICAL_FEATURES,
+            "scaler_mean": self.scaler_mean.tolist(),
+            "scaler_scale": self.scaler_scale.tolist(),
+            "family_survival": None if self.family_survival is None else self.family_survival.to_dict(),
+        }
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(state, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            state = json.load(f)
+        if state["numerical_features"] != NUMERICAL_FEATURES:
+            raise ValueError(f"{path} was fitted for features {state['numerical_features']}")
+
+        pipeline = cls()
+        pipeline.title_mapping = state["title_mapping"]
+        pipeline.age_medians = pd.Series(
+            [median for _, _, median in state["age_medians"]],
+            index=pd.MultiIndex.from_tuples([(title, pclass) for title, pclass, _ in state["age_medians"]],
+                                            names=['Title', 'Pclass']),
+            dtype=float
+        )
+        if "title_age_medians" in state:
+            pipeline.title_age_medians = pd.Series(state["title_age_medians"], dtype=float)
+            pipeline.age_median = state["age_median"]
+        else:
+            # States saved before the fallbacks existed: approximate them from the pair medians
+            pipeline.title_age_medians = pipeline.age_medians.groupby(level='Title').median()
+            pipeline.age_median = float(pipeline.age_medians.median())
+        pipeline.fare_medians = pd.Series({int(pclass): median for pclass, median in state["fare_medians"].items()},
+                                          dtype=float)
+        pipeline.embarked_mode = state["embarked_mode"]
+        pipeline.fare_edges = state["fare_edges"]
+        pipeline.scaler_mean = np.array(state["scaler_mean"])
+        pipeline.scaler_scale = np.array(state["scaler_scale"])
+        if state["family_survival"] is not None:
+            pipeline.family_survival = pd.Series(state["family_survival"], dtype=float)
+        return pipeline
+
+def read_csv_chunks(file_path, chunk_size=CSV_CHUNK_SIZE):
+    return pd.read_csv(file_path, chunksize=chunk_size)
+
+def fit_pipeline_chunked(file_path, chunk_size=CSV_CHUNK_SIZE):
+    # First pass over a file too large for memory; transform_chunks() is the second pass
+    return FeaturePipeline().fit_chunks(read_csv_chunks(file_path, chunk_size))
+
+def holdout_split(df, fraction=HOLDOUT_FRACTION, seed=42):
+    # Stratified on Survived, so the held-out slice keeps the training set's survival rate
+    from sklearn.model_selection import train_test_split
+    return train_test_split(df, test_size=fraction, stratify=df['Survived'], random_state=seed)
+
+def prepare_data(file_path, is_train=True, pipeline=None):
+    df = pd.read_csv(file_path)
+    if pipeline is None:
+        # Fit on this file alone
+        pipeline = FeaturePipeline().fit(df)
+    return pipeline.transform(df, is_train)
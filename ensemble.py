@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+from openai import AsyncOpenAI
+from tqdm import tqdm
+from config import (TEST_OUTPUT, SUBMISSION_FILENAME, MODEL_RESPONSES, ENSEMBLE_JOURNAL, ENSEMBLE_MEMBERS,
+                    ENSEMBLE_TEMPERATURE, MAX_CONCURRENCY, MAX_RETRIES)
+from generate_llm_based_predictions import iter_test_data
+from inference import cached_completion, parse_survival_prediction
+from journal import PredictionJournal, build_outputs_from_journal
+from response_cache import ResponseCache
+from telemetry import Telemetry, print_summary
+from utils.jsonl_io import count_lines
+
+# A member is a model id with an optional sampling seed, written "model" or "model@seed"
+
+def parse_member(spec):
+    model, sep, seed = spec.rpartition('@')
+    if not sep:
+        model, seed = spec, ''
+    return {"name": spec, "model": model, "seed": int(seed) if seed else None}
+
+def member_params(member, temperature):
+    if member["seed"] is None:
+        return {}
+    # Seeded members of the same model only differ when sampling is on
+    return {"seed": member["seed"], "temperature": temperature}
+
+def is_decided(votes, remaining):
+    # The leading verdict wins even if every member still to be asked votes for the other one
+    return abs(votes[1] - votes[0]) > remaining
+
+def calls_needed(votes, remaining):
+    # Fewest further calls that could decide the vote, if they all agree with the current leader
+    leader, other = max(votes[1], votes[0]), min(votes[1], votes[0])
+    return min(remaining, (other + remaining - leader) // 2 + 1)
+
+async def vote_passenger(client, entry, members, semaphore, cache=None, temperature=ENSEMBLE_TEMPERATURE,
+                         max_retries=MAX_RETRIES, telemetry=None):
+    # Members are asked in waves, each only as large as needed to possibly settle the majority
+    votes = {0: 0, 1: 0}
+    responses, errors = {}, {}
+    pending = list(members)
+
+    async def ask(member):
+        async with semaphore:
+            try:
+                response = await cached_completion(
+                    client, member["model"], entry["messages"], cache=cache, max_retries=max_retries,
+                    telemetry=telemetry, **member_params(member, temperature)
+                )
+            except Exception as e:
+                errors[member["name"]] = str(e)
+                return
+        message = response.choices[0].message
+        responses[member["name"]] = message.content
+        survived = parse_survival_prediction(message)
+        if telemetry is not None:
+            telemetry.record_prediction(survived)
+        if survived is not None:
+            votes[survived] += 1
+
+    while pending and not is_decided(votes, len(pending)):
+        n_calls = calls_needed(votes, len(pending))
+        wave, pending = pending[:n_calls], pending[n_calls:]
+        await asyncio.gather(*(ask(member) for member in wave))
+
+    if votes[0] == votes[1]:
+        survived = None  # no majority (only possible with unclear answers or errors)
+    else:
+        survived = int(votes[1] > votes[0])
+    return {
+        "PassengerId": entry["PassengerId"],
+        "ModelResponse": responses,
+        "Survived": survived,
+        "Votes": {"survived": votes[1], "not_survived": votes[0], "calls": len(responses) + len(errors)},
+        "Error": "; ".join(f"{name}: {error}" for name, error in errors.items()) if not responses else None,
+    }
+
+async def predict_ensemble(entries, members, concurrency=MAX_CONCURRENCY, client=None, cache=None,
+                           on_result=None, total=None, temperature=ENSEMBLE_TEMPERATURE, telemetry=None):
+    # Same worker-pool shape as inference.predict_all; the semaphore bounds API calls in flight
+    # across all passengers, whatever the wave sizes
+    if client is None:
+        client = AsyncOpenAI(max_retries=0)
+    semaphore = asyncio.Semaphore(concurrency)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    results = []
+    progress = tqdm(total=total, desc="Ensemble predictions", unit="passenger")
+
+    async def producer():
+        for entry in entries:
+            await queue.put(entry)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker():
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            result = await vote_passenger(client, entry, members, semaphore, cache, temperature, telemetry=telemetry)
+            if on_result is not None:
+                on_result(result)
+            else:
+                results.append(result)
+            progress.update()
+            if telemetry is not None:
+                telemetry.maybe_snapshot()
+
+    try:
+        await asyncio.gather(producer(), *(worker() for _ in range(concurrency)))
+    finally:
+        progress.close()
+
+    results.sort(key=lambda r: r["PassengerId"])
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Majority-vote predictions from several models and/or sampling seeds")
+    parser.add_argument('--members', nargs='+', default=ENSEMBLE_MEMBERS,
+                        help="model ids, optionally with a sampling seed as model@seed")
+    parser.add_argument('--input', default=TEST_OUTPUT, help="formatted JSONL test data")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY,
+                        help="maximum number of requests in flight")
+    parser.add_argument('--temperature', type=float, default=ENSEMBLE_TEMPERATURE,
+                        help="sampling temperature for seeded members")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="bypass the on-disk response cache and always call the API")
+    parser.add_argument('--journal', default=ENSEMBLE_JOURNAL)
+    parser.add_argument('--resume', action='store_true',
+                        help="keep the existing journal and skip passengers already in it")
+    args = parser.parse_args()
+    members = [parse_member(spec) for spec in args.members]
+
+    journal = PredictionJournal(args.journal, resume=args.resume)
+    completed = journal.completed_ids() if args.resume else set()
+    n_passengers = count_lines(args.input) - len(completed)
+    calls = [0]
+
+    def on_result(record):
+        calls[0] += record["Votes"]["calls"]
+        journal.append(record)
+
+    cache = ResponseCache(enabled=not args.no_cache)
+    telemetry = Telemetry("ensemble:" + ",".join(args.members))
+    try:
+        asyncio.run(predict_ensemble(
+            iter_test_data(args.input, skip_ids=completed), members, concurrency=args.concurrency,
+            cache=cache, on_result=on_result, total=n_passengers, temperature=args.temperature,
+            telemetry=telemetry
+        ))
+    finally:
+        journal.close()
+        cache.close()
+        print_summary(telemetry.summary())
+        telemetry.write()
+
+    print(f"{calls[0]} calls for {n_passengers} passengers with {len(members)} members "
+          f"({n_passengers * len(members)} without early stopping)")
+    # Per-member raw responses end up in MODEL_RESPONSES, keyed by member
+    build_outputs_from_journal(args.journal, SUBMISSION_FILENAME, MODEL_RESPONSES)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+import pandas as pd
+from openai import AsyncOpenAI
+from tqdm import tqdm
+from benchmark import git_commit
+from config import TRAIN_FILE, MODEL, MAX_CONCURRENCY, EVAL_RESULTS
+from data_prep import FeaturePipeline, holdout_split
+from inference import cached_completion, parse_survival_prediction
+from prompt_renderer import render_test_entries
+from prompts import PROMPT_LAYOUTS
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache, cache_key
+from utils.cost_estimation import get_pricing
+from utils.jsonl_io import iter_jsonl
+from utils.stats import percentile
+
+# Scores prompt variants on a stratified held-out slice of TRAIN_FILE. The preprocessing is fitted
+# on the rest of the file, so the held-out passengers are prompted like test passengers.
+# A variant is either a layout from prompts.py, or an older generated train JSONL file with one
+# line per TRAIN_FILE row (train_refined.jsonl, ...): its held-out lines are sent without the
+# assistant message. Those files were built from the full training set, so their scores are
+# optimistic next to the layouts'.
+
+def variant_entries(variant, holdout, holdout_df, n_rows):
+    if variant in PROMPT_LAYOUTS:
+        return render_test_entries(holdout, layout=variant)
+
+    rows = dict(zip(holdout_df.index, holdout_df['PassengerId']))  # TRAIN_FILE line -> PassengerId
+    entries = []
+    n_lines = 0
+    for line_number, example in enumerate(iter_jsonl(variant)):
+        n_lines += 1
+        if line_number in rows:
+            messages = [message for message in example["messages"] if message["role"] != "assistant"]
+            entries.append({"PassengerId": int(rows[line_number]), "messages": messages})
+    if n_lines != n_rows:
+        raise ValueError(f"{variant} has {n_lines} lines for {n_rows} rows in {TRAIN_FILE}; only files with "
+                         f"one line per training row (not balanced ones) can be evaluated")
+    return entries
+
+async def complete_unique(requests, concurrency=MAX_CONCURRENCY, client=None, cache=None, limiters=None, **params):
+    # Same worker-pool shape as inference.predict_all, over (model, messages) requests that are
+    # already deduplicated; every model has its own rate limiter
+    if client is None:
+        client = AsyncOpenAI(max_retries=0)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    results = {}
+    progress = tqdm(total=len(requests), desc="Evaluating prompts", unit="request")
+
+    async def producer():
+        for key, request in requests.items():
+            await queue.put((key, request))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            key, (model, messages) = item
+            # Latency is the API call alone; time queued in the rate limiter depends on where the
+            # request sat in the queue, not on the prompt, and is kept apart as "wait"
+            timings = {}
+            try:
+                response = await cached_completion(client, model, messages, cache=cache,
+                                                   limiter=(limiters or {}).get(model), timings=timings, **params)
+                results[key] = {"response": response, "error": None}
+            except Exception as e:
+                results[key] = {"response": None, "error": e}
+            results[key]["latency"] = timings.get("api_seconds")
+            results[key]["wait"] = timings.get("wait_seconds")
+            progress.update()
+
+    try:
+        await asyncio.gather(producer(), *(worker() for _ in range(concurrency)))
+    finally:
+        progress.close()
+    return results
+
+def score(assignments, results, labels, model):
+    # Same defaults as the submission: unclear answers and errors count as "did not survive"
+    correct, unclear, errors, prompt_tokens, completion_tokens, latencies, waits = 0, 0, 0, 0, 0, [], []
+    for passenger_id, key in assignments:
+        result = results[key]
+        if result["error"] is not None:
+            errors += 1
+            survived = 0
+        else:
+            response = result["response"]
+            latencies.append(result["latency"])
+            waits.append(result["wait"])
+            survived = parse_survival_prediction(response.choices[0].message)
+            if survived is None:
+                unclear += 1
+                survived = 0
+            if response.usage is not None:
+                prompt_tokens += response.usage.prompt_tokens
+                completion_tokens += response.usage.completion_tokens
+        correct += survived == labels[passenger_id]
+
+    try:
+        pricing = get_pricing(model)
+        cost = prompt_tokens / 1e6 * pricing["input"] + completion_tokens / 1e6 * pricing["output"]
+    except KeyError:
+        cost = None
+    n = len(assignments)
+    return {
+        "passengers": n,
+        "accuracy": correct / n,
+        "unclear": unclear,
+        "errors": errors,
+        "prompt_tokens_per_request": prompt_tokens / n,
+        "completion_tokens_per_request": completion_tokens / n,
+        "cost_usd": cost,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "wait_p50": percentile(waits, 50),
+    }
+
+def evaluate(variants, models, sample_size=None, concurrency=MAX_CONCURRENCY, cache=None, client=None,
+             rate_limit=True):
+    df = pd.read_csv(TRAIN_FILE)
+    train_df, holdout_df = holdout_split(df)
+    if sample_size is not None:
+        holdout_df = holdout_df.head(sample_size)
+    holdout = FeaturePipeline().fit(train_df).transform(holdout_df, is_train=False)
+    labels = dict(zip(holdout_df['PassengerId'], holdout_df['Survived']))
+
+    # Identical (model, messages) pairs across variants are sent once
+    requests, assignments = {}, {}
+    variants = list(dict.fromkeys(variants))
+    for variant in variants:
+        entries = variant_entries(variant, holdout, holdout_df, len(df))
+        for model in models:
+            pairs = assignments.setdefault((variant, model), [])
+            for entry in entries:
+                key = cache_key(model, entry["messages"])
+                requests.setdefault(key, (model, entry["messages"]))
+                pairs.append((entry["PassengerId"], key))
+    n_requests = sum(len(pairs) for pairs in assignments.values())
+    print(f"{len(holdout_df)} held-out passengers, {len(variants)} variants x {len(models)} models: "
+          f"{len(requests)} unique requests out of {n_requests}")
+
+    limiters = {model: RateLimiter(max_concurrency=concurrency) for model in models} if rate_limit else None
+    started = time.perf_counter()
+    results = asyncio.run(complete_unique(requests, concurrency, client, cache, limiters))
+    seconds = time.perf_counter() - started
+
+    report = {f"{variant} | {model}": score(pairs, results, labels, model)
+              for (variant, model), pairs in assignments.items()}
+    return report, {"holdout": len(holdout_df), "unique_requests": len(requests), "requests": n_requests,
+                    "seconds": seconds}
+
+def print_report(report):
+    # p50/p95 are API latency; "wait" is the median time spent queued in the rate limiter and retrying
+    width = max(len(name) for name in report)
+    print(f"{'variant | model':<{width}} {'accuracy':>9} {'unclear':>8} {'errors':>7} {'in tok':>7} "
+          f"{'out tok':>8} {'cost $':>8} {'p50 s':>6} {'p95 s':>6} {'wait s':>6}")
+
+    def seconds(value):
+        return f"{value:>6.2f}" if value is not None else f"{'?':>6}"
+
+    for name, stats in sorted(report.items(), key=lambda item: -item[1]["accuracy"]):
+        cost = f"{stats['cost_usd']:>8.4f}" if stats["cost_usd"] is not None else f"{'?':>8}"
+        print(f"{name:<{width}} {stats['accuracy']:>9.1%} {stats['unclear']:>8} {stats['errors']:>7} "
+              f"{stats['prompt_tokens_per_request']:>7.0f} {stats['completion_tokens_per_request']:>8.0f} {cost} "
+              f"{seconds(stats['latency_p50'])} {seconds(stats['latency_p95'])} {seconds(stats['wait_p50'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Score prompt variants x models on held-out training passengers")
+    parser.add_argument('--variants', nargs='+', default=list(PROMPT_LAYOUTS),
+                        help=f"layouts ({', '.join(PROMPT_LAYOUTS)}) and/or train JSONL files with one line per row")
+    parser.add_argument('--models', nargs='+', default=[MODEL])
+    parser.add_argument('--sample-size', type=int, default=None,
+                        help="only evaluate the first N held-out passengers, for quick iterations")
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY)
+    parser.add_argument('--no-cache', action='store_true',
+                        help="bypass the on-disk response cache (cached responses report near-zero latency)")
+    parser.add_argument('--no-rate-limit', action='store_true')
+    parser.add_argument('--output', default=EVAL_RESULTS, help="JSONL file that gets one record appended per run")
+    args = parser.parse_args()
+
+    cache = ResponseCache(enabled=not args.no_cache)
+    try:
+        report, run = evaluate(args.variants, args.models, args.sample_size, args.concurrency, cache,
+                               rate_limit=not args.no_rate_limit)
+    finally:
+        cache.close()
+    print_report(report)
+    print(f"{run['unique_requests']} requests in {run['seconds']:.1f}s")
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'a') as f:
+        f.write(json.dumps({"commit": git_commit(), "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                            **run, "results": report}) + '\n')
+    print(f"Results appended to {args.output}")
+
+if __name__ == "__main__":
+    main()
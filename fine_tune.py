@@ -1,21 +1,42 @@
-from openai import OpenAI
+from openai import OpenAI, NotFoundError
+import argparse
+import json
+import os
+import re
 import time
-from config import BASE_DIR, TRAIN_OUTPUT
-
-client = OpenAI()
+from datetime import datetime, timezone
+from build_manifest import hash_file
+from config import TRAIN_OUTPUT, UPLOAD_MANIFEST
+from inference import backoff_delay
+from utils.jsonl_io import loads
 
 # Configuration
-FILENAME = TRAIN_OUTPUT.split('/')[-1]  # Extract filename from the full path
 file_path = TRAIN_OUTPUT
 model = "gpt-4o-mini-2024-07-18"
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.py')
+JOB_TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+EVENTS_PAGE_SIZE = 100
+
+def load_upload_manifest(path=UPLOAD_MANIFEST):
+    # sha256 of an uploaded training file -> its OpenAI file id
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_upload_manifest(manifest, path=UPLOAD_MANIFEST):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
 
-def upload_file(file_path):
+def upload_file(client, file_path, purpose="fine-tune"):
     print(f"Uploading file: {file_path}")
     try:
         with open(file_path, "rb") as file:
             upload_response = client.files.create(
                 file=file,
-                purpose="fine-tune"
+                purpose=purpose
             )
         print(f"File uploaded successfully. File ID: {upload_response.id}")
         return upload_response.id
@@ -23,28 +44,38 @@ def upload_file(file_path):
         print(f"Error uploading file: {str(e)}")
         return None
 
-def get_latest_file_id(filename):
-    print(f"Retrieving file ID for: {filename}")
-    try:
-        response = client.files.list()
-        # Filter files by purpose and filename, then sort by creation time (descending)
-        relevant_files = [
-            f for f in response.data 
-            if f.purpose == "fine-tune" and f.filename == filename
-        ]
-        if not relevant_files:
-            print(f"No file found with name: {filename}")
-            return None
-
-        latest_file = max(relevant_files, key=lambda x: x.created_at)
-        print(f"Latest file ID retrieved: {latest_file.id}")
-        return latest_file.id
-    except Exception as e:
-        print(f"Error retrieving file ID: {str(e)}")
-        return None
+def get_or_upload_file(client, file_path, manifest_path=UPLOAD_MANIFEST):
+    # Files are identified by content, so a rebuilt but unchanged JSONL is not uploaded again
+    content_hash = hash_file(file_path)
+    manifest = load_upload_manifest(manifest_path)
+    known = manifest.get(content_hash)
+    if known is not None:
+        try:
+            client.files.retrieve(known["file_id"])
+            print(f"{file_path} was already uploaded as {known['file_id']}; skipping upload")
+            return known["file_id"]
+        except NotFoundError:
+            print(f"Previously uploaded file {known['file_id']} no longer exists; uploading again")
+
+    file_id = upload_file(client, file_path)
+    if file_id:
+        manifest[content_hash] = {
+            "file_id": file_id,
+            "filename": os.path.basename(file_path),
+            "uploaded_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+        save_upload_manifest(manifest, manifest_path)
+    return file_id
+
+def count_weighted_examples(file_path):
+    # Examples with the top-level "weight" of balance_train_dataset_oversample.py --format weighted.
+    # Fine-tuning does not read it, so such a file would train on each example once.
+    with open(file_path, 'rb') as f:
+        return sum(1 for line in f if b'"weight"' in line and "weight" in loads(line))
 
-def wait_for_file_processing(file_id):
+def wait_for_file_processing(client, file_id, base_delay=2.0, max_delay=60.0):
     print("Waiting for file to be processed...")
+    attempt = 0
     while True:
         file_status = client.files.retrieve(file_id)
         if file_status.status == "processed":
@@ -54,13 +85,14 @@ def wait_for_file_processing(file_id):
             print("Error in file processing.")
             return False
         print("File still processing. Waiting...")
-        time.sleep(10)  # Wait for 10 seconds before checking again
+        time.sleep(base_delay + backoff_delay(attempt, base=base_delay, cap=max_delay))
+        attempt += 1
 
-def start_fine_tuning(file_id, model):
+def start_fine_tuning(client, file_id, model):
     print(f"Starting fine-tuning job with file ID: {file_id}")
     try:
         job = client.fine_tuning.jobs.create(
-            training_file=file_id, 
+            training_file=file_id,
             model=model
         )
         print(f"Fine-tuning job created successfully. Job ID: {job.id}")
@@ -69,24 +101,99 @@ def start_fine_tuning(file_id, model):
         print(f"Error starting fine-tuning job: {str(e)}")
         return None
 
+def new_events(client, job_id, seen):
+    # Events are listed newest first; page back only until an event that was already printed
+    events = []
+    after = None
+    while True:
+        page = client.fine_tuning.jobs.list_events(job_id, limit=EVENTS_PAGE_SIZE,
+                                                   **({"after": after} if after else {}))
+        for event in page.data:
+            if event.id in seen:
+                return events[::-1]
+            events.append(event)
+        if not page.has_more or not page.data:
+            return events[::-1]
+        after = page.data[-1].id
+
+def follow_job(client, job_id, base_delay=5.0, max_delay=300.0):
+    # Print job events as they arrive; polling backs off while nothing happens
+    print(f"Following fine-tuning job {job_id}...")
+    seen = set()
+    attempt = 0
+    while True:
+        # Status first, so the events printed below include everything up to a final status
+        job = client.fine_tuning.jobs.retrieve(job_id)
+        events = new_events(client, job_id, seen)
+        for event in events:
+            seen.add(event.id)
+            stamp = datetime.fromtimestamp(event.created_at, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"[{stamp}] {event.message}")
+
+        if job.status in JOB_TERMINAL_STATUSES:
+            print(f"Fine-tuning job finished with status: {job.status}")
+            return job
+
+        attempt = 0 if events else attempt + 1
+        time.sleep(base_delay + backoff_delay(attempt, base=base_delay, cap=max_delay))
+
+def update_config_model(model_id, job_id, config_file=CONFIG_FILE):
+    # Comment out the active MODEL line and make the fine-tuned model the one inference uses
+    with open(config_file, 'r') as f:
+        lines = f.readlines()
+    for i, line in enumerate(lines):
+        if re.match(r'MODEL\s*=', line):
+            lines[i:i + 1] = ['# ' + line, f'MODEL = "{model_id}"  # fine-tuned by job {job_id}\n']
+            break
+    else:
+        raise ValueError(f"No MODEL setting found in {config_file}")
+    with open(config_file + '.tmp', 'w') as f:
+        f.writelines(lines)
+    os.replace(config_file + '.tmp', config_file)
+    print(f"MODEL in {config_file} set to {model_id}")
+
 def main():
-    # Upload file
-    upload_file(file_path)
-
-    # Get the latest file ID
-    file_id = get_latest_file_id(FILENAME)
-    if not file_id:
-        return
-    print(file_id)
-
-    # Wait for file processing
-    if not wait_for_file_processing(file_id):
-        return
-
-    # Start fine-tuning
-    job_id = start_fine_tuning(file_id, model)
-    if job_id:
+    parser = argparse.ArgumentParser(description="Upload the training JSONL and start a fine-tuning job")
+    parser.add_argument('--file', default=file_path)
+    parser.add_argument('--model', default=model, help="base model to fine-tune")
+    parser.add_argument('--follow', action='store_true',
+                        help="stream job events until it finishes and write the fine-tuned model id into config.py")
+    parser.add_argument('--job-id', help="follow an existing job instead of starting a new one")
+    parser.add_argument('--no-update-config', action='store_true',
+                        help="with --follow, only print the fine-tuned model id")
+    args = parser.parse_args()
+
+    if args.job_id is None:
+        n_weighted = count_weighted_examples(args.file)
+        if n_weighted:
+            print(f"{args.file} has {n_weighted} examples with a per-example weight, which fine-tuning ignores; "
+                  f"write the balanced set with --format jsonl instead")
+            return
+
+    client = OpenAI()
+    job_id = args.job_id
+    if job_id is None:
+        # Upload file, unless this exact content was uploaded before
+        file_id = get_or_upload_file(client, args.file)
+        if not file_id:
+            return
+
+        # Wait for file processing
+        if not wait_for_file_processing(client, file_id):
+            return
+
+        # Start fine-tuning
+        job_id = start_fine_tuning(client, file_id, args.model)
+        if not job_id:
+            return
         print(f"Fine-tuning job started. You can monitor its progress using the job ID: {job_id}")
 
+    if args.follow or args.job_id:
+        job = follow_job(client, job_id)
+        if job.status == "succeeded" and job.fine_tuned_model:
+            print(f"Fine-tuned model: {job.fine_tuned_model}")
+            if not args.no_update_config:
+                update_config_model(job.fine_tuned_model, job_id)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
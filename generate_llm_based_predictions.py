@@ -1,82 +1,104 @@
-from openai import OpenAI
-import pandas as pd
-import json
-import os
-from tqdm import tqdm
-from config import TEST_OUTPUT, SUBMISSION_FILENAME, MODEL_RESPONSES
+import argparse
+import asyncio
+from config import (TEST_OUTPUT, SUBMISSION_FILENAME, MODEL_RESPONSES, PREDICTION_JOURNAL,
+                    MODEL, MAX_CONCURRENCY, INFERENCE_MODE, SURVIVAL_THRESHOLD, TELEMETRY_DIR,
+                    TELEMETRY_SNAPSHOT_SECONDS, RATE_LIMIT_RPM, RATE_LIMIT_TPM)
+from inference import (INFERENCE_MODES, LABEL_PARAMS, parse_label_prediction, parse_survival_prediction,
+                       predict_all, to_label_messages)
+from journal import PredictionJournal, build_outputs_from_journal
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+from telemetry import Telemetry, print_summary
+from utils.jsonl_io import iter_jsonl, count_lines
 
 fp = TEST_OUTPUT
 
-model="gpt-4o-mini-2024-07-18"  # baseline model
-
-# fine-tuned model ID
-# model = "ft:gpt-4o-mini-2024-07-18:personal::A0wPhdQr"  # claude v2
-
-def parse_survival_prediction(response):
-    response_text = str(response).lower()
-    if "survived" in response_text and "did not survive" not in response_text:
-        return 1
-    elif "did not survive" in response_text:
-        return 0
-    else:
-        return None
-
-# Load the formatted JSONL test data
-with open(fp, 'r') as jsonl_file:
-    test_data = [json.loads(line) for line in jsonl_file]
-
-# Initialize the OpenAI client
-client = OpenAI()
-
-# Loop through each prompt and get predictions
-predictions = []
-unclear_predictions = []
-model_responses = []  # New list to store model responses
-
-# Wrap the main loop with tqdm for a progress bar
-for entry in tqdm(test_data, desc="Processing predictions", unit="passenger"):
+def iter_test_data(file_path, skip_ids=(), mode="reasoning"):
+    # Stream the formatted JSONL test data, skipping passengers that are already journaled
+    for entry in iter_jsonl(file_path):
+        if entry["PassengerId"] not in skip_ids:
+            if mode == "label":
+                entry["messages"] = to_label_messages(entry["messages"])
+            yield entry
+
+def journal_record(result, mode="reasoning", threshold=SURVIVAL_THRESHOLD):
+    passenger_id = result["PassengerId"]
+    if result["error"] is not None:
+        return {"PassengerId": passenger_id, "ModelResponse": None, "Survived": None,
+                "Error": str(result["error"])}
+
+    predicted_response = result["response"].choices[0].message
+    if mode == "label":
+        survived, probability = parse_label_prediction(result["response"], threshold)
+        if survived is None:
+            print(f"Unclear prediction for PassengerId {passenger_id}: {predicted_response}")
+        return {"PassengerId": passenger_id, "ModelResponse": predicted_response.content,
+                "Survived": survived, "SurvivalProbability": probability, "Error": None}
+
+    survived = parse_survival_prediction(predicted_response)
+    if survived is None:
+        print(f"Unclear prediction for PassengerId {passenger_id}: {predicted_response}")
+    return {"PassengerId": passenger_id, "ModelResponse": predicted_response.content,
+            "Survived": survived, "Error": None}
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Kaggle submission predictions with an OpenAI chat model")
+    parser.add_argument('--input', default=fp, help="formatted JSONL test data")
+    parser.add_argument('--model', default=MODEL)
+    parser.add_argument('--concurrency', type=int, default=MAX_CONCURRENCY,
+                        help="maximum number of requests in flight")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="bypass the on-disk response cache and always call the API")
+    parser.add_argument('--journal', default=PREDICTION_JOURNAL,
+                        help="append-only JSONL log of finished passengers")
+    parser.add_argument('--resume', action='store_true',
+                        help="keep the existing journal and skip passengers already in it")
+    parser.add_argument('--mode', choices=INFERENCE_MODES, default=INFERENCE_MODE,
+                        help="'reasoning' parses a free-text answer, 'label' asks for one token with logprobs")
+    parser.add_argument('--threshold', type=float, default=SURVIVAL_THRESHOLD,
+                        help="label mode: predict survival when P(survived) is at least this")
+    parser.add_argument('--telemetry-dir', default=TELEMETRY_DIR,
+                        help="where the run summary JSON and Prometheus textfile are written")
+    parser.add_argument('--live-telemetry', action='store_true',
+                        help=f"also refresh snapshot.json and the textfile every {TELEMETRY_SNAPSHOT_SECONDS}s")
+    parser.add_argument('--rpm', type=float, default=RATE_LIMIT_RPM, help="requests-per-minute limit to start from")
+    parser.add_argument('--tpm', type=float, default=RATE_LIMIT_TPM, help="tokens-per-minute limit to start from")
+    parser.add_argument('--no-rate-limit', action='store_true',
+                        help="send requests as fast as --concurrency allows and only back off on 429s")
+    args = parser.parse_args()
+    params = LABEL_PARAMS if args.mode == "label" else {}
+    telemetry = Telemetry(args.model, args.telemetry_dir,
+                          snapshot_interval=TELEMETRY_SNAPSHOT_SECONDS if args.live_telemetry else None)
+
+    def on_result(result):
+        record = journal_record(result, args.mode, args.threshold)
+        if record["Error"] is None:
+            telemetry.record_prediction(record["Survived"])
+        journal.append(record)
+
+    journal = PredictionJournal(args.journal, resume=args.resume)
+    completed = journal.completed_ids() if args.resume else set()
+    if completed:
+        print(f"Resuming: {len(completed)} passengers already journaled")
+
+    limiter = None if args.no_rate_limit else RateLimiter(args.rpm, args.tpm, max_concurrency=args.concurrency)
+    cache = ResponseCache(enabled=not args.no_cache)
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=entry['messages']
-        )
-
-        predicted_response = response.choices[0].message
-        survived = parse_survival_prediction(predicted_response)
-
-        # Store the model's response
-        model_responses.append({
-            "PassengerId": entry["PassengerId"],
-            "ModelResponse": predicted_response.content
-        })
-
-        if survived is not None:
-            predictions.append({"PassengerId": entry["PassengerId"], "Survived": survived})
-        else:
-            print(f"Unclear prediction for PassengerId {entry['PassengerId']}: {predicted_response}")
-            unclear_predictions.append(entry["PassengerId"])
-            print(f"Unclear prediction for PassengerId {entry['PassengerId']}")
-
-    except Exception as e:
-        print(f"Error processing PassengerId {entry['PassengerId']}: {str(e)}")
-        unclear_predictions.append(entry["PassengerId"])
-
-# Handle unclear predictions
-if unclear_predictions:
-    print(f"There were {len(unclear_predictions)} unclear predictions.")
-    for pid in unclear_predictions:
-        predictions.append({"PassengerId": pid, "Survived": 0})
-
-# Ensure the submissions directory exists
-os.makedirs('data/submissions', exist_ok=True)
-
-# Convert predictions to a DataFrame and save to submission file
-submission = pd.DataFrame(predictions)
-submission.to_csv(f'{SUBMISSION_FILENAME}', index=False)
-print(f"Submission file saved as {SUBMISSION_FILENAME} with {len(submission)} predictions")
-
-# Save model responses to a JSON file
-responses_filename = MODEL_RESPONSES
-with open(responses_filename, 'w') as f:
-    json.dump(model_responses, f, indent=2)
-print(f"Model responses saved to {responses_filename}")
\ No newline at end of file
+        asyncio.run(predict_all(
+            iter_test_data(args.input, skip_ids=completed, mode=args.mode), model=args.model,
+            concurrency=args.concurrency, cache=cache, total=count_lines(args.input) - len(completed),
+            on_result=on_result, telemetry=telemetry, limiter=limiter, **params
+        ))
+    finally:
+        journal.close()
+        print(f"Response cache: {cache.stats()}")
+        if limiter is not None:
+            print(f"Rate limiter: {limiter.summary()}")
+        cache.close()
+        print_summary(telemetry.summary())
+        print(f"Telemetry written to {telemetry.write()}")
+
+    build_outputs_from_journal(args.journal, SUBMISSION_FILENAME, MODEL_RESPONSES, threshold=args.threshold)
+
+if __name__ == "__main__":
+    main()
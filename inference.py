@@ -0,0 +1,191 @@
+import asyncio
+import math
+import random
+import time
+import openai
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+from tqdm import tqdm
+from config import MODEL, MAX_CONCURRENCY, MAX_RETRIES, MAX_THROTTLED_SECONDS, SURVIVAL_THRESHOLD
+from response_cache import cache_key
+
+# Errors worth retrying; anything else (bad request, auth, ...) fails the passenger immediately
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+def parse_survival_prediction(response):
+    response_text = str(response).lower()
+    if "survived" in response_text and "did not survive" not in response_text:
+        return 1
+    elif "did not survive" in response_text:
+        return 0
+    else:
+        return None
+
+# Label mode: the model answers with one digit and the logprobs of that token give P(survived)
+INFERENCE_MODES = ("reasoning", "label")
+LABEL_SYSTEM_MESSAGE = ("You are an assistant that predicts Titanic passenger survival. Weigh all the given "
+                        "information and answer with a single digit: 1 if the passenger survived, 0 if not.")
+LABEL_INSTRUCTION = "Answer with a single digit only: 1 if the passenger survived, 0 if they did not survive."
+LABEL_PARAMS = {"max_tokens": 1, "logprobs": True, "top_logprobs": 5, "temperature": 0}
+
+def to_label_messages(messages):
+    label_messages = [{"role": "system", "content": LABEL_SYSTEM_MESSAGE}]
+    for message in messages:
+        if message["role"] == "user":
+            label_messages.append({"role": "user", "content": f"{message['content']}\n\n{LABEL_INSTRUCTION}"})
+    return label_messages
+
+def survival_probability(response):
+    logprobs = response.choices[0].logprobs
+    if logprobs is None or not logprobs.content:
+        return None
+    first_token = logprobs.content[0]
+    probabilities = {"0": 0.0, "1": 0.0}
+    for candidate in first_token.top_logprobs or [first_token]:
+        token = candidate.token.strip()
+        if token in probabilities:
+            probabilities[token] += math.exp(candidate.logprob)
+    total = probabilities["0"] + probabilities["1"]
+    return probabilities["1"] / total if total else None
+
+def parse_label_prediction(response, threshold=SURVIVAL_THRESHOLD):
+    # Returns (Survived, P(survived)); falls back to the answered digit when no logprobs came back
+    probability = survival_probability(response)
+    if probability is not None:
+        return int(probability >= threshold), probability
+    answer = (response.choices[0].message.content or "").strip()
+    return {"1": 1, "0": 0}.get(answer[:1]), None
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def is_too_large(error):
+    # "Request too large for ... tokens per min": the request alone exceeds the limit and never fits
+    return isinstance(error, openai.RateLimitError) and "request too large" in str(error).lower()
+
+def is_throttled(error):
+    # 429s from the RPM/TPM limits clear by themselves; an exhausted quota or an oversized request does not
+    return (isinstance(error, openai.RateLimitError) and getattr(error, "code", None) != "insufficient_quota"
+            and not is_too_large(error))
+
+async def complete_with_retries(client, model, messages, max_retries=MAX_RETRIES, telemetry=None, limiter=None,
+                                max_throttled_seconds=MAX_THROTTLED_SECONDS, timings=None, **params):
+    # With a limiter, throttled requests wait for it and are retried without using up max_retries,
+    # so a burst of 429s does not turn passengers into unclear predictions; a request still
+    # throttled after max_throttled_seconds fails like any other exhausted retry.
+    # `timings` gets api_seconds (the successful call) and wait_seconds (limiter queueing, retries)
+    attempt = 0
+    started = time.perf_counter()
+    timings = {} if timings is None else timings
+    while True:
+        try:
+            if limiter is None:
+                called = time.perf_counter()
+                response = await client.chat.completions.create(model=model, messages=messages, **params)
+                timings["api_seconds"] = time.perf_counter() - called
+            else:
+                response = await limiter.create(client, model, messages, timings=timings, **params)
+        except RETRYABLE_ERRORS as e:
+            throttled = limiter is not None and is_throttled(e)
+            if throttled and time.perf_counter() - started < max_throttled_seconds:
+                if telemetry is not None:
+                    telemetry.record_retry(e)
+                continue
+            if throttled or is_too_large(e) or attempt >= max_retries:
+                if telemetry is not None:
+                    telemetry.record_error(e, time.perf_counter() - started)
+                raise
+            if telemetry is not None:
+                telemetry.record_retry(e)
+            await asyncio.sleep(backoff_delay(attempt))
+            attempt += 1
+        except Exception as e:
+            if telemetry is not None:
+                telemetry.record_error(e, time.perf_counter() - started)
+            raise
+        else:
+            elapsed = time.perf_counter() - started
+            timings["wait_seconds"] = elapsed - timings["api_seconds"]
+            if telemetry is not None:
+                telemetry.record_response(response, elapsed)
+            return response
+
+async def cached_completion(client, model, messages, cache=None, max_retries=MAX_RETRIES, telemetry=None,
+                            limiter=None, timings=None, **params):
+    if cache is None:
+        return await complete_with_retries(client, model, messages, max_retries=max_retries,
+                                           telemetry=telemetry, limiter=limiter, timings=timings, **params)
+
+    key = cache_key(model, messages, **params)
+    cached = cache.get(key)
+    if cached is not None:
+        if telemetry is not None:
+            telemetry.record_cache_hit()
+        if timings is not None:
+            timings.update(api_seconds=0.0, wait_seconds=0.0)
+        return ChatCompletion.model_validate(cached)
+
+    response = await complete_with_retries(client, model, messages, max_retries=max_retries,
+                                           telemetry=telemetry, limiter=limiter, timings=timings, **params)
+    cache.put(key, model, response.model_dump(mode='json'))
+    return response
+
+async def predict_all(entries, model=MODEL, concurrency=MAX_CONCURRENCY, client=None,
+                      cache=None, on_result=None, total=None, max_retries=MAX_RETRIES, telemetry=None,
+                      limiter=None, **params):
+    # Runs every entry with at most `concurrency` requests in flight (fewer when a rate limiter
+    # is given and throttles). Each result holds either the response or the error; results are
+    # passed to `on_result` as they finish when it is given (so nothing accumulates in memory),
+    # otherwise returned ordered by PassengerId
+    if client is None:
+        # Retries are handled per request below, so disable the client's own
+        client = AsyncOpenAI(max_retries=0)
+
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    results = []
+    if total is None and hasattr(entries, '__len__'):
+        total = len(entries)
+    progress = tqdm(total=total, desc="Processing predictions", unit="passenger")
+
+    async def producer():
+        for entry in entries:
+            await queue.put(entry)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker():
+        while True:
+            entry = await queue.get()
+            if entry is None:
+                return
+            started = time.perf_counter()
+            try:
+                response = await cached_completion(
+                    client, model, entry['messages'], cache=cache, max_retries=max_retries,
+                    telemetry=telemetry, limiter=limiter, **params
+                )
+                result = {"PassengerId": entry["PassengerId"], "response": response, "error": None}
+            except Exception as e:
+                result = {"PassengerId": entry["PassengerId"], "response": None, "error": e}
+            result["latency"] = time.perf_counter() - started
+            if on_result is not None:
+                on_result(result)
+            else:
+                results.append(result)
+            progress.update()
+            if telemetry is not None:
+                telemetry.maybe_snapshot()
+
+    try:
+        await asyncio.gather(producer(), *(worker() for _ in range(concurrency)))
+    finally:
+        progress.close()
+
+    results.sort(key=lambda r: r["PassengerId"])
+    return results
@@ -0,0 +1,121 @@
+import csv
+import json
+import os
+
+class PredictionJournal:
+    # Append-only JSONL log of finished passengers, one record per line
+    def __init__(self, path, resume=False):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if resume:
+            _drop_partial_line(path)
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def completed_ids(self):
+        # Passengers that errored are left out so a resumed run retries them
+        completed = set()
+        for record in iter_journal(self.path):
+            if record.get("Error") is None:
+                completed.add(record["PassengerId"])
+            else:
+                completed.discard(record["PassengerId"])
+        return completed
+
+    def append(self, record):
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def _drop_partial_line(path):
+    # A crash mid-write can leave a truncated last line; cut it so new records start on a fresh line
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 65536)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b'\n')
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            f.truncate(position)
+
+def iter_journal(path):
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a truncated last line
+                continue
+
+def _index_journal(path):
+    # Map PassengerId -> byte offset of its latest record, without keeping the responses in memory
+    offsets = {}
+    with open(path, 'rb') as f:
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            offsets[record["PassengerId"]] = offset
+    return offsets
+
+def build_outputs_from_journal(journal_path, submission_path, responses_path, threshold=None):
+    offsets = _index_journal(journal_path)
+    unclear_predictions = []
+
+    os.makedirs(os.path.dirname(submission_path) or '.', exist_ok=True)
+    with open(journal_path, 'rb') as journal, \
+            open(submission_path, 'w', newline='') as submission_file, \
+            open(responses_path, 'w') as responses_file:
+        writer = csv.writer(submission_file, lineterminator='\n')
+        writer.writerow(["PassengerId", "Survived"])
+
+        # Same layout as json.dump(model_responses, f, indent=2), written one response at a time
+        n_responses = 0
+        for passenger_id in sorted(offsets):
+            journal.seek(offsets[passenger_id])
+            record = json.loads(journal.readline())
+
+            if record.get("Error") is not None:
+                print(f"Error processing PassengerId {passenger_id}: {record['Error']}")
+            else:
+                item = {"PassengerId": passenger_id, "ModelResponse": record["ModelResponse"]}
+                if record.get("SurvivalProbability") is not None:
+                    item["SurvivalProbability"] = record["SurvivalProbability"]
+                item = json.dumps(item, indent=2)
+                responses_file.write(("[\n" if n_responses == 0 else ",\n") + _indent(item))
+                n_responses += 1
+
+            survived = record.get("Survived")
+            if threshold is not None and record.get("SurvivalProbability") is not None:
+                # Label-mode records can be re-thresholded without calling the API again
+                survived = int(record["SurvivalProbability"] >= threshold)
+            if survived is None:
+                unclear_predictions.append(passenger_id)
+                survived = 0
+            writer.writerow([passenger_id, survived])
+
+        responses_file.write("\n]" if n_responses else "[]")
+
+    # Unclear predictions and errors default to not surviving
+    if unclear_predictions:
+        print(f"There were {len(unclear_predictions)} unclear predictions.")
+    print(f"Submission file saved as {submission_path} with {len(offsets)} predictions")
+    print(f"Model responses saved to {responses_path}")
+
+def _indent(text, prefix='  '):
+    return '\n'.join(prefix + line for line in text.split('\n'))
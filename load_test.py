@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import time
+from itertools import cycle, islice
+from openai import AsyncOpenAI
+from config import TEST_OUTPUT, MODEL, RATE_LIMIT_RPM, RATE_LIMIT_TPM
+from inference import complete_with_retries, parse_survival_prediction
+from mock_server import add_server_arguments, start_server, state_from_args
+from rate_limiter import RateLimiter
+from telemetry import Telemetry, print_summary
+from utils.jsonl_io import iter_jsonl
+from utils.stats import percentile
+
+# Open-loop load test of the prediction request path (complete_with_retries, with or without the
+# rate limiter) at a target rate. Requests start on schedule whether or not earlier ones have
+# finished, and latency is measured from the scheduled start, so queueing delay shows up in the
+# tail instead of silently lowering the offered load.
+MAX_IN_FLIGHT = 512  # guard against unbounded pile-up when the target rate is unreachable
+
+async def run_load(entries, qps, n_requests, client, model=MODEL, limiter=None, telemetry=None,
+                   max_in_flight=MAX_IN_FLIGHT):
+    semaphore = asyncio.Semaphore(max_in_flight)
+    latencies, outcomes = [], {"ok": 0, "error": 0, "unclear": 0}
+
+    async def send(entry, scheduled):
+        async with semaphore:
+            try:
+                response = await complete_with_retries(client, model, entry["messages"], telemetry=telemetry,
+                                                       limiter=limiter)
+            except Exception:
+                outcomes["error"] += 1
+                return
+        latencies.append(time.perf_counter() - scheduled)
+        outcomes["ok" if parse_survival_prediction(response.choices[0].message) is not None else "unclear"] += 1
+
+    started = time.perf_counter()
+    tasks = []
+    for i, entry in enumerate(islice(cycle(entries), n_requests)):
+        scheduled = started + i / qps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(entry, scheduled)))
+    offered_seconds = time.perf_counter() - started
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "target_qps": qps,
+        "requests": n_requests,
+        "offered_qps": n_requests / offered_seconds if offered_seconds else None,
+        "achieved_qps": outcomes["ok"] / elapsed,
+        "elapsed_seconds": elapsed,
+        **outcomes,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "latency_max": max(latencies) if latencies else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Push the prediction request path at a target rate and report "
+                                                 "throughput and tail latency (against a mock server by default)")
+    parser.add_argument('--qps', type=float, default=20.0, help="target requests per second")
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--input', default=TEST_OUTPUT, help="formatted JSONL test data, cycled as needed")
+    parser.add_argument('--model', default=MODEL)
+    parser.add_argument('--base-url', default=None,
+                        help="API to load (default: start a mock server in-process with the options below)")
+    parser.add_argument('--rate-limit', action='store_true',
+                        help="send through the RPM/TPM rate limiter, as generate_llm_based_predictions.py does")
+    parser.add_argument('--client-rpm', type=float, default=RATE_LIMIT_RPM)
+    parser.add_argument('--client-tpm', type=float, default=RATE_LIMIT_TPM)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    if args.base_url is None:
+        server, base_url = start_server(state_from_args(args))
+        print(f"Mock server on {base_url}")
+    else:
+        base_url = args.base_url
+    client = AsyncOpenAI(base_url=base_url, api_key="mock" if server else None, max_retries=0)
+    limiter = RateLimiter(args.client_rpm, args.client_tpm, max_concurrency=MAX_IN_FLIGHT) if args.rate_limit else None
+    telemetry = Telemetry(args.model)
+
+    try:
+        report = asyncio.run(run_load(list(iter_jsonl(args.input)), args.qps, args.requests, client, args.model,
+                                      limiter, telemetry))
+    finally:
+        if server is not None:
+            print(f"Mock server: {server.RequestHandlerClass.state.counts}")
+            server.shutdown()
+
+    print(f"Target {report['target_qps']:.1f} qps, offered {report['offered_qps']:.1f} qps, "
+          f"achieved {report['achieved_qps']:.1f} qps over {report['elapsed_seconds']:.1f}s")
+    print(f"{report['ok']} ok, {report['unclear']} unclear, {report['error']} failed")
+    if report["latency_p50"] is not None:
+        print(f"Latency from scheduled start: p50 {report['latency_p50']:.3f}s, p95 {report['latency_p95']:.3f}s, "
+              f"p99 {report['latency_p99']:.3f}s, max {report['latency_max']:.3f}s")
+    if limiter is not None:
+        print(f"Rate limiter: {limiter.summary()}")
+    print_summary(telemetry.summary())
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,84 @@
-import json
+import argparse
 import pandas as pd
-from data_prep import prepare_data
-from prompts import generate_prompt, create_assistant_message, SYSTEM_MESSAGE
-from config import TRAIN_FILE, TEST_FILE, TRAIN_OUTPUT, TEST_OUTPUT
+from build_manifest import hash_code, hash_file, hash_values, is_up_to_date, write_incremental, write_streaming
+from data_prep import FeaturePipeline, fit_pipeline_chunked, prepare_data, read_csv_chunks
+from prompt_renderer import render_train_lines, render_test_lines
+from utils.format_validation import FormatValidator
+from utils.jsonl_io import JsonlWriter
+from config import TRAIN_FILE, TEST_FILE, TRAIN_OUTPUT, TEST_OUTPUT, PROMPT_LAYOUT, PIPELINE_STATE
 
-def create_train_jsonl(data, output_file):
-    with open(output_file, 'w') as f:
-        for _, passenger in data.iterrows():
-            entry = {
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": SYSTEM_MESSAGE
-                    },
-                    {
-                        "role": "user",
-                        "content": generate_prompt(passenger, is_train=True)
-                    },
-                    {
-                        "role": "assistant",
-                        "content": create_assistant_message(passenger)
-                    }
-                ]
-            }
-            json.dump(entry, f)
-            f.write('\n')
+# Rows are rendered column-wise in chunks so only one chunk of prompt text is held in memory
+RENDER_CHUNK_SIZE = 10000
 
-def create_test_jsonl(data, output_file):
-    with open(output_file, 'w') as f:
-        for _, passenger in data.iterrows():
-            entry = {
-                "PassengerId": int(passenger['PassengerId']),
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": SYSTEM_MESSAGE
-                    },
-                    {
-                        "role": "user",
-                        "content": generate_prompt(passenger, is_train=False)
-                    }
-                ]
-            }
-            json.dump(entry, f)
-            f.write('\n')
+def create_train_jsonl(data, output_file, layout=PROMPT_LAYOUT, validate=True):
+    # A malformed record raises ValueError with its line number as soon as it is written
+    validator = FormatValidator(require_assistant=True, fail_fast=True) if validate else None
+    with JsonlWriter(output_file, validator=validator) as writer:
+        for start in range(0, len(data), RENDER_CHUNK_SIZE):
+            writer.write_lines(render_train_lines(data.iloc[start:start + RENDER_CHUNK_SIZE], layout=layout))
+
+def create_test_jsonl(data, output_file, layout=PROMPT_LAYOUT, validate=True):
+    validator = FormatValidator(require_assistant=False, fail_fast=True) if validate else None
+    with JsonlWriter(output_file, validator=validator) as writer:
+        for start in range(0, len(data), RENDER_CHUNK_SIZE):
+            writer.write_lines(render_test_lines(data.iloc[start:start + RENDER_CHUNK_SIZE], layout=layout))
 
 
 
 def main():
-    # Prepare and process training data
-    print("Processing training data...")
-    train_data = prepare_data(TRAIN_FILE, is_train=True)
-    create_train_jsonl(train_data, TRAIN_OUTPUT)
-    print(f"Training data processed and saved to {TRAIN_OUTPUT}")
+    parser = argparse.ArgumentParser(description="Build the training and test JSONL files")
+    parser.add_argument('--force', action='store_true',
+                        help="rebuild every row even if the build manifests say nothing changed")
+    parser.add_argument('--chunk-size', type=int,
+                        help="read the CSVs in chunks of this many rows (two passes, bounded memory) "
+                             "instead of loading them whole")
+    args = parser.parse_args()
+
+    # Test features depend on the training data too, since preprocessing is fitted on it.
+    # Chunked fits can use approximate fare quantiles, so they are fingerprinted separately.
+    code_hash = hash_code(PROMPT_LAYOUT, *(['chunked'] if args.chunk_size else []))
+    train_hash = hash_file(TRAIN_FILE)
+    train_fingerprint = hash_values(code_hash, train_hash, 'train')
+    test_fingerprint = hash_values(code_hash, train_hash, hash_file(TEST_FILE), 'test')
+
+    if not args.force and is_up_to_date(TRAIN_OUTPUT, train_fingerprint) and is_up_to_date(TEST_OUTPUT, test_fingerprint):
+        print(f"{TRAIN_OUTPUT} and {TEST_OUTPUT} are up to date")
+        return
+
+    # Fit preprocessing once on the training data and reuse it for the test data
+    if args.chunk_size:
+        pipeline = fit_pipeline_chunked(TRAIN_FILE, args.chunk_size)
+    else:
+        pipeline = FeaturePipeline().fit(pd.read_csv(TRAIN_FILE))
+    pipeline.save(PIPELINE_STATE)
+    print(f"Feature pipeline fitted on {TRAIN_FILE} and saved to {PIPELINE_STATE}")
+
+    builds = [
+        ("training", TRAIN_FILE, TRAIN_OUTPUT, True, train_fingerprint,
+         lambda chunk: render_train_lines(chunk, layout=PROMPT_LAYOUT)),
+        ("test", TEST_FILE, TEST_OUTPUT, False, test_fingerprint,
+         lambda chunk: render_test_lines(chunk, layout=PROMPT_LAYOUT)),
+    ]
+    for name, input_file, output_file, is_train, fingerprint, render_lines in builds:
+        if not args.force and is_up_to_date(output_file, fingerprint):
+            print(f"{output_file} is up to date")
+            continue
+
+        print(f"Processing {name} data...")
+        # Every line is checked as it is written; a malformed one fails the build before the output is replaced
+        validator = FormatValidator(require_assistant=is_train, fail_fast=True)
+        if args.chunk_size:
+            # Second pass: transform and render one chunk at a time straight into the output
+            chunks = pipeline.transform_chunks(read_csv_chunks(input_file, args.chunk_size), is_train)
+            n_rows = write_streaming(chunks, output_file, render_lines, fingerprint, code_hash, validator=validator)
+            print(f"{name.capitalize()} data processed and saved to {output_file} ({n_rows} rows rendered)")
+            continue
 
-    # Prepare and process test data
-    print("Processing test data...")
-    test_data = prepare_data(TEST_FILE, is_train=False)
-    create_test_jsonl(test_data, TEST_OUTPUT)
-    print(f"Test data processed and saved to {TEST_OUTPUT}")
+        # Prepare and process the data, re-rendering only rows that changed since the last build
+        data = prepare_data(input_file, is_train=is_train, pipeline=pipeline)
+        n_rendered = write_incremental(data, output_file, render_lines, fingerprint, code_hash,
+                                       RENDER_CHUNK_SIZE, reuse=not args.force, validator=validator)
+        print(f"{name.capitalize()} data processed and saved to {output_file} ({n_rendered}/{len(data)} rows rendered)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,336 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from rate_limiter import TokenBucket
+
+# Local stand-in for the OpenAI endpoints this repo calls: chat completions, files, fine-tuning
+# jobs and batches. Point the scripts at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:8080/v1 OPENAI_API_KEY=mock python cli.py predict
+# Replies are deterministic: passengers described as female or as a Master (boys) survive, everyone
+# else does not. Latency, injected 429/500 errors and optional RPM/TPM limits are configurable.
+DEFAULT_PORT = 8080
+DEFAULT_LATENCY = "lognormal:0.5:0.6"
+JOB_SECONDS = 5.0  # a fine-tuning job runs this long before it succeeds
+JOB_STAGES = ["Validating training file", "Fine-tuning job started", "Step 1/100: training loss=0.52",
+              "Step 100/100: training loss=0.11", "The job has successfully completed"]
+
+SURVIVED_REPLY = ("Weighing sex, age and class against the historical survival rates, this passenger most "
+                  "likely survived.\n\nPrediction: Survived (confidence: medium)")
+NOT_SURVIVED_REPLY = ("Weighing sex, age and class against the historical survival rates, this passenger most "
+                      "likely did not survive.\n\nPrediction: Did not survive (confidence: medium)")
+
+def parse_latency(spec):
+    # "fixed:S", "uniform:LOW:HIGH" or "lognormal:MEDIAN:SIGMA", all in seconds
+    name, *params = spec.split(':')
+    params = [float(p) for p in params]
+    if name == "fixed" and len(params) == 1:
+        return lambda rng: params[0]
+    if name == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(*params)
+    if name == "lognormal" and len(params) == 2:
+        return lambda rng: rng.lognormvariate(math.log(params[0]), params[1])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+def predicts_survival(messages):
+    prompt = " ".join(m.get("content") or "" for m in messages if m.get("role") == "user")
+    return bool(re.search(r'\bfemale\b|\bMaster\b', prompt))
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+def chat_completion(body):
+    # Label-mode requests (max_tokens=1 with logprobs) get a digit and its top logprobs
+    survived = predicts_survival(body.get("messages", []))
+    label_mode = body.get("max_tokens") == 1
+    content = ("1" if survived else "0") if label_mode else (SURVIVED_REPLY if survived else NOT_SURVIVED_REPLY)
+    logprobs = None
+    if body.get("logprobs"):
+        top = [{"token": "1", "logprob": math.log(0.9 if survived else 0.1), "bytes": None},
+               {"token": "0", "logprob": math.log(0.1 if survived else 0.9), "bytes": None}]
+        logprobs = {"content": [{"token": content[:1], "logprob": max(t["logprob"] for t in top), "bytes": None,
+                                 "top_logprobs": top[:body.get("top_logprobs") or 0]}], "refusal": None}
+    prompt_tokens = sum(estimate_tokens(m.get("content") or "") + 4 for m in body.get("messages", [])) + 3
+    completion_tokens = 1 if label_mode else estimate_tokens(content)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{"index": 0, "finish_reason": "length" if label_mode else "stop", "logprobs": logprobs,
+                     "message": {"role": "assistant", "content": content, "refusal": None}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+def error_body(message, type_, code=None):
+    return {"error": {"message": message, "type": type_, "param": None, "code": code}}
+
+class MockState:
+    def __init__(self, latency=DEFAULT_LATENCY, rate_429=0.0, rate_500=0.0, rpm=None, tpm=None, job_seconds=JOB_SECONDS,
+                 seed=42):
+        self.latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.job_seconds = job_seconds
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.files, self.file_contents, self.jobs, self.batches = {}, {}, {}, {}
+        self.counts = {"chat": 0, "injected_429": 0, "injected_500": 0, "rate_limited": 0}
+
+    def sample(self):
+        # (latency, injected error or None); one lock so the seeded sequence is shared by all threads
+        with self.lock:
+            latency = self.latency(self.rng)
+            draw = self.rng.random()
+        if draw < self.rate_429:
+            return latency, 429
+        if draw < self.rate_429 + self.rate_500:
+            return latency, 500
+        return latency, None
+
+    def take_limits(self, n_tokens):
+        # Returns (allowed, headers) against the optional RPM/TPM buckets
+        headers = {}
+        with self.lock:
+            for name, bucket, amount in [("requests", self.requests, 1), ("tokens", self.tokens, n_tokens)]:
+                if bucket is None:
+                    continue
+                if bucket.wait_time(amount) > 0:
+                    return False, {f"x-ratelimit-limit-{name}": str(int(bucket.per_minute)),
+                                   f"x-ratelimit-remaining-{name}": "0",
+                                   f"x-ratelimit-reset-{name}": f"{int(bucket.wait_time(amount) * 1000)}ms"}
+            for name, bucket, amount in [("requests", self.requests, 1), ("tokens", self.tokens, n_tokens)]:
+                if bucket is not None:
+                    bucket.take(amount)
+                    headers[f"x-ratelimit-limit-{name}"] = str(int(bucket.per_minute))
+                    # The bucket holds one second's burst; report its fill as a share of the minute
+                    remaining = max(0.0, bucket.level) / bucket.capacity * bucket.per_minute
+                    headers[f"x-ratelimit-remaining-{name}"] = str(int(remaining))
+                    headers[f"x-ratelimit-reset-{name}"] = "1s"
+        return True, headers
+
+    def add_file(self, content, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        obj = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+               "filename": filename, "purpose": purpose, "status": "processed", "status_details": None}
+        with self.lock:
+            self.files[file_id] = obj
+            self.file_contents[file_id] = content
+        return obj
+
+    def job_view(self, job):
+        # Jobs advance with wall-clock time: queued, running, then succeeded after job_seconds
+        elapsed = time.time() - job["created_at"]
+        stage = min(len(JOB_STAGES), int(elapsed / self.job_seconds * (len(JOB_STAGES) - 1)) + 1)
+        view = dict(job)
+        if elapsed >= self.job_seconds:
+            view.update(status="succeeded", finished_at=int(job["created_at"] + self.job_seconds),
+                        fine_tuned_model=f"ft:{job['model']}:mock::{job['id'][-8:]}", trained_tokens=100000)
+        else:
+            view["status"] = "queued" if stage <= 1 else "running"
+        events = [{"id": f"ftevent-{job['id'][-8:]}-{i}", "object": "fine_tuning.job.event",
+                   "created_at": int(job["created_at"] + i * self.job_seconds / (len(JOB_STAGES) - 1)),
+                   "level": "info", "message": message, "data": {}, "type": "message"}
+                  for i, message in enumerate(JOB_STAGES[:stage])]
+        return view, events[::-1]  # events are listed newest first
+
+    def run_batch(self, batch_id):
+        # Batches complete right away: every request line is answered like a chat completion
+        with self.lock:
+            batch = self.batches[batch_id]
+            lines = self.file_contents[batch["input_file_id"]].decode().splitlines()
+        outputs = []
+        for line in filter(str.strip, lines):
+            request = json.loads(line)
+            outputs.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": request["custom_id"], "error": None,
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": chat_completion(request["body"])},
+            }))
+        output = self.add_file(("\n".join(outputs) + "\n").encode(), f"{batch_id}_output.jsonl", "batch_output")
+        with self.lock:
+            batch.update(status="completed", output_file_id=output["id"], completed_at=int(time.time()),
+                         request_counts={"total": len(outputs), "completed": len(outputs), "failed": 0})
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_POST(self):
+        path = urlsplit(self.path).path.removeprefix("/v1")
+        body = self.read_body()
+        if path == "/chat/completions":
+            return self.chat(json.loads(body))
+        if path == "/files":
+            return self.upload(body)
+        if path == "/fine_tuning/jobs":
+            return self.create_job(json.loads(body))
+        if path == "/batches":
+            return self.create_batch(json.loads(body))
+        self.send_json(404, error_body(f"Unknown endpoint POST {path}", "invalid_request_error"))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path, query = url.path.removeprefix("/v1"), parse_qs(url.query)
+        state = self.state
+        if match := re.fullmatch(r'/files/([\w-]+)/content', path):
+            content = state.file_contents.get(match[1])
+            if content is None:
+                return self.not_found("file", match[1])
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            return self.wfile.write(content)
+        if match := re.fullmatch(r'/files/([\w-]+)', path):
+            obj = state.files.get(match[1])
+            return self.send_json(200, obj) if obj else self.not_found("file", match[1])
+        if match := re.fullmatch(r'/fine_tuning/jobs/([\w-]+)(/events)?', path):
+            job = state.jobs.get(match[1])
+            if job is None:
+                return self.not_found("fine-tuning job", match[1])
+            view, events = state.job_view(job)
+            if not match[2]:
+                return self.send_json(200, view)
+            if "after" in query:
+                ids = [event["id"] for event in events]
+                events = events[ids.index(query["after"][0]) + 1:] if query["after"][0] in ids else []
+            limit = int(query.get("limit", ["20"])[0])
+            return self.send_json(200, {"object": "list", "data": events[:limit], "has_more": len(events) > limit})
+        if match := re.fullmatch(r'/batches/([\w-]+)', path):
+            batch = state.batches.get(match[1])
+            return self.send_json(200, batch) if batch else self.not_found("batch", match[1])
+        self.send_json(404, error_body(f"Unknown endpoint GET {path}", "invalid_request_error"))
+
+    def not_found(self, kind, object_id):
+        self.send_json(404, error_body(f"No such {kind}: {object_id}", "invalid_request_error"))
+
+    def chat(self, body):
+        state = self.state
+        latency, injected = state.sample()
+        response = chat_completion(body)
+        allowed, headers = state.take_limits(response["usage"]["total_tokens"])
+        with state.lock:
+            state.counts["chat"] += 1
+        if not allowed or injected == 429:
+            with state.lock:
+                state.counts["rate_limited" if not allowed else "injected_429"] += 1
+            # Injected 429s say when to retry; limit 429s carry the reset time of the exhausted limit
+            if allowed:
+                headers["retry-after-ms"] = "200"
+            return self.send_json(429, error_body("Rate limit reached (mock server)", "requests", "rate_limit_exceeded"),
+                                  headers)
+        time.sleep(latency)
+        if injected == 500:
+            with state.lock:
+                state.counts["injected_500"] += 1
+            return self.send_json(500, error_body("The server had an error (mock server)", "server_error"))
+        self.send_json(200, response, headers)
+
+    def upload(self, body):
+        # multipart/form-data with a `file` part and a `purpose` field
+        message = BytesParser(policy=HTTP).parsebytes(
+            b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+        fields, content, filename = {}, b"", "upload.jsonl"
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if part.get_filename():
+                content, filename = part.get_payload(decode=True), part.get_filename()
+            else:
+                fields[name] = part.get_content().strip()
+        self.send_json(200, self.state.add_file(content, filename, fields.get("purpose", "fine-tune")))
+
+    def create_job(self, body):
+        state = self.state
+        if body.get("training_file") not in state.files:
+            return self.not_found("file", body.get("training_file"))
+        job_id = f"ftjob-{uuid.uuid4().hex[:24]}"
+        job = {"id": job_id, "object": "fine_tuning.job", "created_at": int(time.time()), "error": None,
+               "fine_tuned_model": None, "finished_at": None, "hyperparameters": {"n_epochs": "auto"},
+               "model": body["model"], "organization_id": "org-mock", "result_files": [], "seed": 42,
+               "status": "queued", "trained_tokens": None, "training_file": body["training_file"],
+               "validation_file": body.get("validation_file")}
+        with state.lock:
+            state.jobs[job_id] = job
+        self.send_json(200, state.job_view(job)[0])
+
+    def create_batch(self, body):
+        state = self.state
+        if body.get("input_file_id") not in state.files:
+            return self.not_found("file", body.get("input_file_id"))
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        batch = {"id": batch_id, "object": "batch", "endpoint": body["endpoint"], "errors": None,
+                 "input_file_id": body["input_file_id"], "completion_window": body["completion_window"],
+                 "status": "in_progress", "output_file_id": None, "error_file_id": None,
+                 "created_at": int(time.time()), "in_progress_at": int(time.time()),
+                 "request_counts": {"total": 0, "completed": 0, "failed": 0}, "metadata": body.get("metadata")}
+        with state.lock:
+            state.batches[batch_id] = batch
+        threading.Thread(target=state.run_batch, args=(batch_id,), daemon=True).start()
+        self.send_json(200, batch)
+
+def start_server(state, host="127.0.0.1", port=0):
+    # Serves on a background thread; port 0 picks a free port. Returns (server, base_url).
+    handler = type("Handler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+def add_server_arguments(parser):
+    parser.add_argument('--latency', default=DEFAULT_LATENCY,
+                        help="chat latency: fixed:S, uniform:LOW:HIGH or lognormal:MEDIAN:SIGMA (seconds)")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="fraction of chat requests answered with a 429")
+    parser.add_argument('--rate-500', type=float, default=0.0, help="fraction of chat requests answered with a 500")
+    parser.add_argument('--rpm', type=float, default=None, help="enforce a requests-per-minute limit")
+    parser.add_argument('--tpm', type=float, default=None, help="enforce a tokens-per-minute limit")
+    parser.add_argument('--job-seconds', type=float, default=JOB_SECONDS, help="how long fine-tuning jobs run")
+    parser.add_argument('--seed', type=int, default=42)
+
+def state_from_args(args):
+    return MockState(args.latency, args.rate_429, args.rate_500, args.rpm, args.tpm, args.job_seconds, args.seed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local mock of the OpenAI endpoints the pipeline uses")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_server(state_from_args(args), args.host, args.port)
+    print(f"Mock OpenAI server on {base_url}; use OPENAI_BASE_URL={base_url} OPENAI_API_KEY=mock")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"Requests: {server.RequestHandlerClass.state.counts}")
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
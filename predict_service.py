@@ -0,0 +1,228 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+from openai import AsyncOpenAI
+from config import (TRAIN_FILE, PIPELINE_STATE, MODEL, PROMPT_LAYOUT, MAX_CONCURRENCY, SURVIVAL_THRESHOLD,
+                    RATE_LIMIT_RPM, RATE_LIMIT_TPM, SERVICE_PORT, SERVICE_LRU_SIZE,
+                    SERVICE_TIMEOUT_SECONDS)
+from data_prep import FeaturePipeline
+from inference import (INFERENCE_MODES, LABEL_PARAMS, complete_with_retries, parse_label_prediction,
+                       parse_survival_prediction, to_label_messages)
+from prompt_renderer import render_test_entries
+from rate_limiter import RateLimiter
+from response_cache import cache_key
+
+# Long-lived prediction service for one passenger at a time. The fitted preprocessing, the prompt
+# templates and a pooled API client stay in memory, so a request costs a one-row transform, one
+# render and (unless the LRU already has the same prompt) one model call.
+#   curl -s localhost:8000/predict -d '{"Pclass": 3, "Name": "Kelly, Mr. James", "Sex": "male", "Age": 34.5}'
+RAW_COLUMNS = {'PassengerId': 'int64', 'Pclass': 'int64', 'Name': object, 'Sex': object, 'Age': 'float64',
+               'SibSp': 'int64', 'Parch': 'int64', 'Ticket': object, 'Fare': 'float64', 'Cabin': object,
+               'Embarked': object}
+REQUIRED_FIELDS = ('Pclass', 'Name', 'Sex')
+STRING_FIELDS = ('Name', 'Ticket', 'Cabin', 'Embarked')
+DEFAULTS = {'PassengerId': 0, 'SibSp': 0, 'Parch': 0}
+
+def load_pipeline(path=PIPELINE_STATE):
+    if os.path.exists(path):
+        return FeaturePipeline.load(path)
+    print(f"{path} not found; fitting the feature pipeline on {TRAIN_FILE}")
+    pipeline = FeaturePipeline().fit(pd.read_csv(TRAIN_FILE))
+    pipeline.save(path)
+    return pipeline
+
+def passenger_frame(passenger):
+    # One raw row with the dtypes read_csv gives test.csv; missing or null fields are NaN like empty cells
+    if not isinstance(passenger, dict):
+        raise ValueError("expected a JSON object with the passenger's test.csv fields")
+    missing = [field for field in REQUIRED_FIELDS if passenger.get(field) is None]
+    if missing:
+        raise ValueError(f"missing required fields: {', '.join(missing)}")
+    if passenger['Sex'] not in ('male', 'female'):
+        raise ValueError("Sex must be 'male' or 'female'")
+    if passenger['Pclass'] not in (1, 2, 3):
+        raise ValueError("Pclass must be 1, 2 or 3")
+    not_strings = [field for field in STRING_FIELDS if passenger.get(field) is not None
+                   and not isinstance(passenger[field], str)]
+    if not_strings:
+        raise ValueError(f"fields must be strings: {', '.join(not_strings)}")
+    row = {**DEFAULTS, **{k: v for k, v in passenger.items() if v is not None}}
+    try:
+        return pd.DataFrame({name: pd.Series([row.get(name, np.nan)], dtype=dtype) for name, dtype in RAW_COLUMNS.items()})
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid field value: {e}")
+
+class LRUCache:
+    def __init__(self, maxsize=SERVICE_LRU_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+class PredictionService:
+    def __init__(self, pipeline, model=MODEL, layout=PROMPT_LAYOUT, mode="reasoning", threshold=SURVIVAL_THRESHOLD,
+                 client=None, limiter=None, lru_size=SERVICE_LRU_SIZE):
+        self.pipeline = pipeline
+        self.model = model
+        self.layout = layout
+        self.mode = mode
+        self.threshold = threshold
+        self.params = LABEL_PARAMS if mode == "label" else {}
+        self.client = client
+        self.limiter = limiter
+        self.lru = LRUCache(lru_size)
+        self.in_flight = {}  # identical prompts already being asked share one call
+
+    def render(self, passenger):
+        data = self.pipeline.transform(passenger_frame(passenger), is_train=False)
+        entry = render_test_entries(data, layout=self.layout)[0]
+        if self.mode == "label":
+            entry["messages"] = to_label_messages(entry["messages"])
+        return entry
+
+    async def complete(self, messages):
+        # LRU keyed like the response cache; the passenger id is not part of the prompt, so repeated
+        # profiles hit it whatever their id
+        key = cache_key(self.model, messages, **self.params)
+        response = self.lru.get(key)
+        if response is not None:
+            return response, True
+        if key not in self.in_flight:
+            self.in_flight[key] = asyncio.ensure_future(complete_with_retries(
+                self.client, self.model, messages, limiter=self.limiter, **self.params))
+        try:
+            response = await asyncio.shield(self.in_flight[key])
+        finally:
+            self.in_flight.pop(key, None)
+        self.lru.put(key, response)
+        return response, False
+
+    async def answer(self, entry):
+        response, cached = await self.complete(entry["messages"])
+        message = response.choices[0].message
+        result = {"PassengerId": entry["PassengerId"], "ModelResponse": message.content, "cached": cached}
+        if self.mode == "label":
+            result["Survived"], result["SurvivalProbability"] = parse_label_prediction(response, self.threshold)
+        else:
+            result["Survived"] = parse_survival_prediction(message)
+        return result
+
+    async def predict(self, passenger):
+        return await self.answer(self.render(passenger))
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+    loop = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self.send_json(200, {"status": "ok", "model": self.service.model, "mode": self.service.mode,
+                                        "lru": self.service.lru.stats()})
+        self.send_json(404, {"error": f"unknown endpoint GET {self.path}"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path != "/predict":
+            return self.send_json(404, {"error": f"unknown endpoint POST {self.path}"})
+        # The pandas transform runs on this request's thread, so only the API call uses the event loop
+        started = time.perf_counter()
+        try:
+            entry = self.service.render(json.loads(body))
+        except ValueError as e:
+            return self.send_json(400, {"error": str(e)})
+        except (KeyError, TypeError) as e:
+            # Field values that pass the checks but not the feature parsing (a Name without "Surname, Title.")
+            return self.send_json(400, {"error": f"could not prepare passenger: {type(e).__name__}: {e}"})
+        except Exception as e:
+            return self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+        rendered = time.perf_counter()
+        future = asyncio.run_coroutine_threadsafe(self.service.answer(entry), self.loop)
+        try:
+            result = future.result(timeout=SERVICE_TIMEOUT_SECONDS)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return self.send_json(504, {"error": f"no answer from {self.service.model} within "
+                                                 f"{SERVICE_TIMEOUT_SECONDS}s"})
+        except Exception as e:
+            return self.send_json(502, {"error": f"{type(e).__name__}: {e}"})
+        result["timings_ms"] = {"prepare": round((rendered - started) * 1000, 2),
+                                "model": round((time.perf_counter() - rendered) * 1000, 2)}
+        self.send_json(200, result)
+
+def start_service(service, host="127.0.0.1", port=SERVICE_PORT):
+    # HTTP requests are handled on threads; predictions run on one event loop thread that owns the
+    # pooled async client. Returns (server, loop); port 0 picks a free port.
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    if service.client is None:
+        service.client = AsyncOpenAI(max_retries=0)
+    handler = type("Handler", (ServiceHandler,), {"service": service, "loop": loop})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, loop
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve single-passenger survival predictions over HTTP")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--model', default=MODEL)
+    parser.add_argument('--mode', choices=INFERENCE_MODES, default="reasoning")
+    parser.add_argument('--threshold', type=float, default=SURVIVAL_THRESHOLD)
+    parser.add_argument('--lru-size', type=int, default=SERVICE_LRU_SIZE, help="responses kept in memory")
+    parser.add_argument('--no-rate-limit', action='store_true')
+    args = parser.parse_args()
+
+    limiter = None if args.no_rate_limit else RateLimiter(RATE_LIMIT_RPM, RATE_LIMIT_TPM, max_concurrency=MAX_CONCURRENCY)
+    service = PredictionService(load_pipeline(), args.model, mode=args.mode, threshold=args.threshold,
+                                limiter=limiter, lru_size=args.lru_size)
+    service.render({"Pclass": 3, "Name": "Doe, Mr. John", "Sex": "male"})  # warm up pandas before the first request
+    server, loop = start_service(service, args.host, args.port)
+    print(f"Serving predictions from {args.model} on http://{args.host}:{server.server_address[1]}/predict")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        loop.call_soon_threadsafe(loop.stop)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from config import FEATURE_IMPORTANCE
 import numpy as np
 import pandas as pd
@@ -19,11 +20,79 @@ SYSTEM_MESSAGE = """You are an assistant that predicts Titanic passenger surviva
     Your analysis should be thorough and logical, reflecting the complex interplay of factors that influenced 
     survival on the Titanic."""
 
-def generate_prompt(passenger, is_train=True):
+CLASS_NAMES = ["first", "second", "third"]
+
+# Map embarkation ports
+EMBARKATION_PORTS = {'S': 'Southampton', 'C': 'Cherbourg', 'Q': 'Queenstown'}
+
+# These statistics are derived from historical analyses of the Titanic passenger list
+SURVIVAL_RATES = {
+    ('male', 1): 0.34,  # First-class males had a survival rate of approximately 34%
+    ('male', 2): 0.15,  # Second-class males had a survival rate of approximately 15%
+    ('male', 3): 0.13,  # Third-class males had a survival rate of approximately 13%
+    ('female', 1): 0.97,  # First-class females had a survival rate of approximately 97%
+    ('female', 2): 0.86,  # Second-class females had a survival rate of approximately 86%
+    ('female', 3): 0.47   # Third-class females had a survival rate of approximately 47%
+}
+
+# Prompt fragments are built from plain scalars so the row-wise functions below and the
+# columnar renderer in prompt_renderer.py share one definition. Fragments that depend only
+# on categorical values are memoized; typed=True keeps e.g. 1 and 1.0 from sharing an entry.
+FRAGMENT_CACHE_SIZE = 65536
+
+# Prompt layouts:
+#   classic - the original prompt, passenger details interleaved with the invariant text
+#   prefix  - same wording, but all invariant text comes first and the passenger details last,
+#             so consecutive requests share the longest possible prefix for provider-side caching
+#   compact - prefix layout with shorter instructions and without the breakdown sentences that
+#             repeat the narrative (class, family size, title)
+PROMPT_LAYOUTS = ("classic", "prefix", "compact")
+
+INSTRUCTIONS = """Please provide your prediction by following these steps:
+
+1. Analyze the key factors affecting this passenger's survival chances.
+2. Compare the passenger's profile to the historical survival rates.
+3. Consider any uncertainty factors and their potential impact.
+4. Weigh the evidence for and against survival.
+5. Make a final prediction and explain your confidence level.
+
+When responding make sure to provide your step-by-step reasoning, concluding with your prediction and confidence level (low, medium, or high)."""
+
+COMPACT_INSTRUCTIONS = """Reason step by step: weigh the key factors, compare the passenger with the historical survival rates and consider any uncertainty. Conclude with 'Survived' or 'Did not survive' and your confidence (low, medium, or high)."""
+
+STATIC_PREFIXES = {
+    "prefix": f"""Predict the survival of the following Titanic passenger using step-by-step reasoning.
+
+Historical Context:
+{HISTORICAL_CONTEXT}
+
+{INSTRUCTIONS}
+
+""",
+    "compact": f"""Predict the survival of the Titanic passenger described below.
+
+Historical Context:
+{HISTORICAL_CONTEXT}
+
+{COMPACT_INSTRUCTIONS}
+
+""",
+}
+
+def generate_prompt(passenger, is_train=True, layout="classic"):
     narrative = create_narrative(passenger)
-    analysis = create_analytical_breakdown(passenger)
-    comparison = create_comparative_analysis(passenger) if is_train else ""
+    if layout == "compact":
+        analysis = compact_analysis_text(passenger['Sex'], passenger['AgeBin'], passenger['Pclass'])
+        comparison = compact_comparison_text(passenger['Sex'], passenger['Pclass'], passenger['AgeBin']) if is_train else ""
+    else:
+        analysis = create_analytical_breakdown(passenger)
+        comparison = create_comparative_analysis(passenger) if is_train else ""
     uncertainty = identify_uncertainty_factors(passenger)
+    return format_prompt(narrative, analysis, comparison, uncertainty, layout=layout)
+
+def format_prompt(narrative, analysis, comparison, uncertainty, layout="classic"):
+    if layout != "classic":
+        return STATIC_PREFIXES[layout] + format_passenger_section(narrative, analysis, comparison, uncertainty)
 
     prompt = f"""Predict the survival of the following Titanic passenger using step-by-step reasoning:
 
@@ -40,105 +109,146 @@ Historical Context:
 
 {uncertainty}
 
-Please provide your prediction by following these steps:
-
-1. Analyze the key factors affecting this passenger's survival chances.
-2. Compare the passenger's profile to the historical survival rates.
-3. Consider any uncertainty factors and their potential impact.
-4. Weigh the evidence for and against survival.
-5. Make a final prediction and explain your confidence level.
-
-When responding make sure to provide your step-by-step reasoning, concluding with your prediction and confidence level (low, medium, or high)."""
+{INSTRUCTIONS}"""
 
     return prompt
 
+def format_passenger_section(narrative, analysis, comparison, uncertainty):
+    sections = [f"Passenger Information:\n{narrative}", f"Analytical Breakdown:\n{analysis}", comparison, uncertainty]
+    return "\n\n".join(section for section in sections if section)
+
 
 def create_narrative(passenger):
     age = int(passenger['Age_Original'])
-    age_desc = "elderly" if age > 65 else "middle-aged" if age > 30 else "young"
-    class_desc = ["first", "second", "third"][passenger['Pclass'] - 1]
     family_size = max(1, round(passenger['FamilySize']))  # Ensure minimum of 1
-    family_desc = "alone" if family_size == 1 else f"with {family_size - 1} family member(s)"
-    
-    # Map embarkation ports
-    embarkation_ports = {'S': 'Southampton', 'C': 'Cherbourg', 'Q': 'Queenstown'}
-    embarkation = embarkation_ports.get(passenger['Embarked'], 'an unknown port')
-    
-    narrative = f"{passenger['Title']} {passenger['LastName']}, a {age}-year-old {passenger['Sex']} passenger, "
-    narrative += f"embarked on the Titanic's maiden voyage in {class_desc}-class. "
-    narrative += f"Traveling {family_desc}, they boarded at {embarkation} "
-    narrative += f"with a {passenger['FareBin'].lower()} fare. "
+    return narrative_text(passenger['Title'], passenger['LastName'], age, passenger['Sex'],
+                          passenger['Pclass'], family_size, passenger['Embarked'],
+                          passenger['FareBin'], passenger['Cabin'])
+
+def narrative_text(title, last_name, age, sex, pclass, family_size, embarked, fare_bin, cabin):
+    narrative = f"{title} {last_name}"
+    narrative += _narrative_details(age, sex, pclass, family_size, embarked, fare_bin)
     
-    if pd.notna(passenger['Cabin']) and passenger['Cabin'] != 'U':
-        narrative += f"Their cabin was {passenger['Cabin']}."
+    if pd.notna(cabin) and cabin != 'U':
+        narrative += f"Their cabin was {cabin}."
     else:
         narrative += "Their specific cabin location is unknown."
     
     return narrative
 
-def create_analytical_breakdown(passenger):
-    analysis = f"{passenger['Title']} {passenger['LastName']}'s survival chances are influenced by several factors: "
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE, typed=True)
+def _narrative_details(age, sex, pclass, family_size, embarked, fare_bin):
+    class_desc = CLASS_NAMES[pclass - 1]
+    family_desc = "alone" if family_size == 1 else f"with {family_size - 1} family member(s)"
+    embarkation = EMBARKATION_PORTS.get(embarked, 'an unknown port')
     
-    if passenger['Sex'] == 'male':
+    details = f", a {age}-year-old {sex} passenger, "
+    details += f"embarked on the Titanic's maiden voyage in {class_desc}-class. "
+    details += f"Traveling {family_desc}, they boarded at {embarkation} "
+    details += f"with a {fare_bin.lower()} fare. "
+    return details
+
+def create_analytical_breakdown(passenger):
+    family_size = max(1, round(passenger['FamilySize']))  # Ensure minimum of 1
+    return analysis_text(passenger['Title'], passenger['LastName'], passenger['Sex'], passenger['AgeBin'],
+                         int(passenger['Age_Original']), passenger['Pclass'], family_size)
+
+def analysis_text(title, last_name, sex, age_bin, age, pclass, family_size):
+    analysis = f"{title} {last_name}'s survival chances are influenced by several factors: "
+    return analysis + _analysis_details(title, sex, age_bin, age, pclass, family_size)
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE, typed=True)
+def _analysis_details(title, sex, age_bin, age, pclass, family_size):
+    analysis = ""
+    if sex == 'male':
         analysis += "Being male significantly reduces survival probability due to the 'women and children first' protocol. "
     else:
         analysis += "Being female increases survival chances due to the 'women and children first' protocol. "
     
-    analysis += f"Their {passenger['AgeBin'].lower()} age of {int(passenger['Age_Original'])} "
-    if passenger['AgeBin'] in ['Child', 'Teenager']:
+    analysis += f"Their {age_bin.lower()} age of {age} "
+    if age_bin in ['Child', 'Teenager']:
         analysis += "is advantageous. "
-    elif passenger['AgeBin'] == 'Elderly':
+    elif age_bin == 'Elderly':
         analysis += "may be disadvantageous. "
     else:
         analysis += "is neutral. "
     
-    analysis += f"Traveling in {['first', 'second', 'third'][passenger['Pclass'] - 1]}-class "
-    if passenger['Pclass'] == 1:
+    analysis += f"Traveling in {CLASS_NAMES[pclass - 1]}-class "
+    if pclass == 1:
         analysis += "provides better access to lifeboats. "
-    elif passenger['Pclass'] == 3:
+    elif pclass == 3:
         analysis += "limits access to lifeboats. "
     else:
         analysis += "offers moderate lifeboat access. "
     
-    family_size = max(1, round(passenger['FamilySize']))  # Ensure minimum of 1
     if family_size == 1:
         analysis += "Traveling alone may affect decision-making during the crisis. "
     else:
         analysis += f"Traveling with {family_size - 1} family member(s) could influence evacuation choices. "
     
     # Interpret social status
-    class_desc = ["first", "second", "third"][passenger['Pclass'] - 1]
-    analysis += f"Their status as a {passenger['Title']} in {class_desc}-class may affect treatment during evacuation."
+    class_desc = CLASS_NAMES[pclass - 1]
+    analysis += f"Their status as a {title} in {class_desc}-class may affect treatment during evacuation."
     
     return analysis
 
 def create_comparative_analysis(passenger):
-    # These statistics are derived from historical analyses of the Titanic passenger list
-    survival_rates = {
-        ('male', 1): 0.34,  # First-class males had a survival rate of approximately 34%
-        ('male', 2): 0.15,  # Second-class males had a survival rate of approximately 15%
-        ('male', 3): 0.13,  # Third-class males had a survival rate of approximately 13%
-        ('female', 1): 0.97,  # First-class females had a survival rate of approximately 97%
-        ('female', 2): 0.86,  # Second-class females had a survival rate of approximately 86%
-        ('female', 3): 0.47   # Third-class females had a survival rate of approximately 47%
-    }
-
-    overall_rate = survival_rates.get((passenger['Sex'], passenger['Pclass']), 0.3)
-    age_group_rate = overall_rate * 1.1 if passenger['AgeBin'] in ['Child', 'Teenager'] else overall_rate * 0.9
+    return comparison_text(passenger['Sex'], passenger['Pclass'], passenger['AgeBin'])
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE, typed=True)
+def comparison_text(sex, pclass, age_bin):
+    overall_rate = SURVIVAL_RATES.get((sex, pclass), 0.3)
+    age_group_rate = overall_rate * 1.1 if age_bin in ['Child', 'Teenager'] else overall_rate * 0.9
 
     return f"""Comparative Analysis: 
-    Among {passenger['Sex']} passengers in {['first', 'second', 'third'][passenger['Pclass'] - 1]} class, 
+    Among {sex} passengers in {CLASS_NAMES[pclass - 1]} class, 
     the historical survival rate was approximately {overall_rate:.0%}. 
-    For passengers of similar age ({passenger['AgeBin'].lower()}), the estimated survival rate is about {age_group_rate:.0%}."""
+    For passengers of similar age ({age_bin.lower()}), the estimated survival rate is about {age_group_rate:.0%}."""
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE, typed=True)
+def compact_analysis_text(sex, age_bin, pclass):
+    if sex == 'male':
+        analysis = "Male: reduces survival under 'women and children first'. "
+    else:
+        analysis = "Female: increases survival under 'women and children first'. "
+
+    if age_bin in ['Child', 'Teenager']:
+        analysis += f"{age_bin}: advantageous. "
+    elif age_bin == 'Elderly':
+        analysis += f"{age_bin}: may be disadvantageous. "
+    else:
+        analysis += f"{age_bin}: neutral. "
+
+    if pclass == 1:
+        analysis += "First-class: better lifeboat access."
+    elif pclass == 3:
+        analysis += "Third-class: limited lifeboat access."
+    else:
+        analysis += "Second-class: moderate lifeboat access."
+    return analysis
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE, typed=True)
+def compact_comparison_text(sex, pclass, age_bin):
+    overall_rate = SURVIVAL_RATES.get((sex, pclass), 0.3)
+    age_group_rate = overall_rate * 1.1 if age_bin in ['Child', 'Teenager'] else overall_rate * 0.9
+    return (f"Historical survival rate: ~{overall_rate:.0%} for {sex} {CLASS_NAMES[pclass - 1]}-class passengers, "
+            f"~{age_group_rate:.0%} at {age_bin.lower()} age.")
 
 
 def identify_uncertainty_factors(passenger):
+    return uncertainty_text(bool(np.isclose(passenger['Age'], passenger['Age_Original'])),
+                            bool(np.isclose(passenger['Fare'], passenger['Fare_Original'])),
+                            passenger['Cabin'] == 'U')
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE, typed=True)
+def uncertainty_text(age_estimated, fare_estimated, cabin_unknown):
     factors = []
-    if np.isclose(passenger['Age'], passenger['Age_Original']):
+    if age_estimated:
         factors.append("The passenger's exact age was unknown and has been estimated.")
-    if np.isclose(passenger['Fare'], passenger['Fare_Original']):
+    if fare_estimated:
         factors.append("The passenger's exact fare was unknown and has been estimated.")
-    if passenger['Cabin'] == 'U':
+    if cabin_unknown:
         factors.append("The passenger's cabin location is unknown.")
     
     if factors:
@@ -147,28 +257,36 @@ def identify_uncertainty_factors(passenger):
         return "No significant uncertainty factors identified."
 
 def create_assistant_message(passenger):
-    survived = "survived" if passenger['Survived'] == 1 else "did not survive"
+    return assistant_text(passenger['Title'], passenger['LastName'], passenger['Survived'], passenger['Sex'],
+                          passenger['Pclass'], passenger['AgeBin'], passenger['FareBin'], passenger['FamilySize'])
+
+def assistant_text(title, last_name, survived, sex, pclass, age_bin, fare_bin, family_size):
+    survived = "survived" if survived == 1 else "did not survive"
+    return f"Based on the information provided, {title} {last_name} {survived}. " \
+           f"Reasoning: {_assistant_reasoning(sex, pclass, age_bin, fare_bin, family_size)}"
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE, typed=True)
+def _assistant_reasoning(sex, pclass, age_bin, fare_bin, family_size):
     reasons = []
     
-    if passenger['Sex'] == 'female':
+    if sex == 'female':
         reasons.append("being female generally increased survival chances")
     else:
         reasons.append("being male generally reduced survival chances")
     
-    if passenger['Pclass'] == 1:
+    if pclass == 1:
         reasons.append("first-class passengers had better survival rates")
-    elif passenger['Pclass'] == 3:
+    elif pclass == 3:
         reasons.append("third-class passengers had lower survival rates")
     
-    if passenger['AgeBin'] in ['Child', 'Teenager']:
+    if age_bin in ['Child', 'Teenager']:
         reasons.append("children were often prioritized for rescue")
     
-    if passenger['FareBin'] in ['High', 'Very High']:
+    if fare_bin in ['High', 'Very High']:
         reasons.append("passengers with expensive tickets may have had better access to lifeboats")
     
-    if passenger['FamilySize'] > 1:
-        reasons.append(f"traveling with {passenger['FamilySize'] - 1} family member(s) could have influenced survival")
+    if family_size > 1:
+        reasons.append(f"traveling with {family_size - 1} family member(s) could have influenced survival")
     
     reasoning = " and ".join(reasons)
-    return f"Based on the information provided, {passenger['Title']} {passenger['LastName']} {survived}. " \
-           f"Reasoning: {reasoning.capitalize() if reasoning else 'Multiple factors influenced survival rates, including class, gender, age, and location on the ship.'}"
+    return reasoning.capitalize() if reasoning else 'Multiple factors influenced survival rates, including class, gender, age, and location on the ship.'
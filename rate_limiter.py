@@ -0,0 +1,184 @@
+import asyncio
+import re
+import time
+from functools import lru_cache
+from config import MAX_CONCURRENCY, RATE_LIMIT_RPM, RATE_LIMIT_TPM
+from utils.cost_estimation import EXPECTED_OUTPUT_TOKENS, TokenCounter
+
+# Client-side scheduling for the org's requests-per-minute and tokens-per-minute limits. Every
+# request draws one unit from a request bucket and its estimated tokens from a token bucket
+# before it is sent; the buckets are kept in line with the x-ratelimit-* response headers, and
+# the number of requests in flight adapts AIMD-style (halved on a 429, +1 per window of successes).
+LOW_WATER = 0.1  # stop growing concurrency when less than this fraction of either limit remains
+MESSAGE_OVERHEAD_TOKENS = 4  # chat format tokens per message, plus 3 to prime the reply
+BURST_SECONDS = 1.0  # the API enforces per-minute limits over shorter periods, so bursts stay small
+DEFAULT_PAUSE_SECONDS = 1.0  # pause after a 429 that carries no reset or retry-after header
+
+@lru_cache(maxsize=None)
+def token_counter():
+    # Same tiktoken encoding as utils/cost_estimation.py
+    try:
+        return TokenCounter(num_threads=1)
+    except Exception:
+        return None  # no tiktoken encoding available: fall back to ~4 characters per token
+
+def estimate_tokens(messages, max_tokens=None):
+    # What the request counts against the TPM limit: prompt tokens plus the completion budget
+    contents = [message["content"] for message in messages]
+    counter = token_counter()
+    if counter is not None:
+        prompt_tokens = sum(counter.count_many(contents))
+    else:
+        prompt_tokens = sum(len(content) for content in contents) // 4
+    prompt_tokens += MESSAGE_OVERHEAD_TOKENS * len(messages) + 3
+    return prompt_tokens + (max_tokens or EXPECTED_OUTPUT_TOKENS)
+
+def parse_duration(value):
+    # Reset headers look like "1s", "6m0s", "20ms" or "1h2m3.5s"
+    if value is None:
+        return None
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+def rate_limit_headers(headers):
+    def number(name):
+        value = headers.get(name)
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    retry_after = number("retry-after-ms")
+    retry_after = retry_after / 1000 if retry_after is not None else number("retry-after")
+    return {
+        "limit_requests": number("x-ratelimit-limit-requests"),
+        "limit_tokens": number("x-ratelimit-limit-tokens"),
+        "remaining_requests": number("x-ratelimit-remaining-requests"),
+        "remaining_tokens": number("x-ratelimit-remaining-tokens"),
+        "reset_requests": parse_duration(headers.get("x-ratelimit-reset-requests")),
+        "reset_tokens": parse_duration(headers.get("x-ratelimit-reset-tokens")),
+        "retry_after": retry_after,
+    }
+
+class TokenBucket:
+    # Refills continuously at `per_minute` / 60 per second, holding at most BURST_SECONDS worth.
+    # The level may go negative when the server reports less headroom than we assumed; requests
+    # then wait until it recovers.
+    def __init__(self, per_minute, burst_seconds=BURST_SECONDS):
+        self.burst_seconds = burst_seconds
+        self.set_limit(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def set_limit(self, per_minute):
+        self.per_minute = float(per_minute)
+        self.rate = self.per_minute / 60
+        self.capacity = self.rate * self.burst_seconds
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # Requests larger than the whole bucket only wait for a full bucket
+        self.refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.refill()
+        self.level -= amount
+
+    def sync(self, limit, remaining):
+        # The server's view wins when it has less headroom than ours
+        self.refill()
+        if limit and limit != self.per_minute:
+            self.set_limit(limit)
+            self.level = min(self.level, self.capacity)
+        if remaining is not None:
+            self.level = min(self.level, remaining)
+
+    def fraction_left(self, remaining):
+        # Share of the per-minute limit the server still had when it answered
+        return remaining / self.per_minute if remaining is not None else 1.0
+
+class RateLimiter:
+    def __init__(self, rpm=RATE_LIMIT_RPM, tpm=RATE_LIMIT_TPM, max_concurrency=MAX_CONCURRENCY, min_concurrency=1):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.condition = asyncio.Condition()
+        self.stats = {"requests": 0, "rate_limited": 0, "wait_seconds": 0.0, "min_concurrency": max_concurrency}
+
+    async def acquire(self, estimated_tokens):
+        # Returns when a concurrency slot is free and both buckets can pay for the request
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.concurrency))
+            self.in_flight += 1
+        started = time.monotonic()
+        while True:
+            delay = max(self.paused_until - time.monotonic(), self.requests.wait_time(1),
+                        self.tokens.wait_time(estimated_tokens))
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        self.requests.take(1)
+        self.tokens.take(estimated_tokens)
+        self.stats["requests"] += 1
+        self.stats["wait_seconds"] += time.monotonic() - started
+        return time.monotonic()
+
+    async def release(self, sent, headers=None, rate_limited=False):
+        limits = rate_limit_headers(headers) if headers is not None else {}
+        self.requests.sync(limits.get("limit_requests"), limits.get("remaining_requests"))
+        self.tokens.sync(limits.get("limit_tokens"), limits.get("remaining_tokens"))
+
+        if rate_limited:
+            self.stats["rate_limited"] += 1
+            pause = limits.get("retry_after") or max(limits.get("reset_requests") or 0,
+                                                     limits.get("reset_tokens") or 0) or DEFAULT_PAUSE_SECONDS
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            # One decrease per congestion event: requests sent before the last decrease don't count again
+            if sent >= self.last_decrease:
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                self.last_decrease = time.monotonic()
+                self.stats["min_concurrency"] = min(self.stats["min_concurrency"], int(self.concurrency))
+        elif min(self.requests.fraction_left(limits.get("remaining_requests")),
+                 self.tokens.fraction_left(limits.get("remaining_tokens"))) > LOW_WATER:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    async def create(self, client, model, messages, timings=None, **params):
+        # One chat completion through the limiter; the raw response gives access to the headers.
+        # `timings` gets the seconds spent in the API call itself, without the wait in acquire.
+        sent = await self.acquire(estimate_tokens(messages, params.get("max_tokens")))
+        try:
+            raw = await client.chat.completions.with_raw_response.create(model=model, messages=messages, **params)
+        except Exception as e:
+            response = getattr(e, "response", None)
+            await self.release(sent, getattr(response, "headers", None),
+                               rate_limited=getattr(response, "status_code", None) == 429)
+            raise
+        if timings is not None:
+            timings["api_seconds"] = time.monotonic() - sent
+        await self.release(sent, raw.headers)
+        return raw.parse()
+
+    def summary(self):
+        return {**self.stats, "concurrency": int(self.concurrency), "rpm": self.requests.per_minute,
+                "tpm": self.tokens.per_minute}
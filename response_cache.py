@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from config import RESPONSE_CACHE, CACHE_MAX_SIZE_MB, CACHE_MAX_AGE_DAYS
+
+def cache_key(model, messages, **params):
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True, separators=(',', ':'), ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    # Content-addressed store of chat completion responses, keyed by cache_key()
+    def __init__(self, path=RESPONSE_CACHE, max_size_mb=CACHE_MAX_SIZE_MB,
+                 max_age_days=CACHE_MAX_AGE_DAYS, enabled=True):
+        self.path = path
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if not enabled:
+            return
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed_at ON responses (accessed_at)")
+        self.evict()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, model, response):
+        if not self.enabled:
+            return
+        payload = json.dumps(response)
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, payload, len(payload), now, now)
+        )
+        self.conn.commit()
+
+    def evict(self):
+        if not self.enabled:
+            return 0
+        cutoff = time.time() - self.max_age_seconds
+        removed = self.conn.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+        # Keep the most recently used responses that fit within the size budget
+        removed += self.conn.execute("""
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS running_size
+                    FROM responses
+                ) WHERE running_size > ?
+            )""", (self.max_bytes,)).rowcount
+        self.conn.commit()
+        return removed
+
+    def stats(self):
+        entries, size = 0, 0
+        if self.enabled:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "size_bytes": size}
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,194 @@
+import json
+import math
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from config import TELEMETRY_DIR
+
+# Upper bounds (seconds / tokens) of the histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120, math.inf)
+TOKEN_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 200, 300, 400, 500, 750, 1000, 1500, 2000, 4000, math.inf)
+
+class Histogram:
+    # Fixed buckets, so memory does not grow with the number of requests; percentiles are
+    # interpolated linearly inside the bucket that holds them
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = self.count * q / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = min(self.buckets[i], self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max if self.count else None,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+class Telemetry:
+    # Per-request metrics for one run against one model. inference.py reports API responses,
+    # retries, errors and cache hits; callers report parsed predictions. Nothing here is per-passenger.
+    def __init__(self, model, output_dir=TELEMETRY_DIR, snapshot_interval=None):
+        self.model = model
+        self.output_dir = output_dir
+        self.snapshot_interval = snapshot_interval
+        self.started = time.time()
+        self.last_snapshot = time.monotonic()
+
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.prompt_tokens = Histogram(TOKEN_BUCKETS)
+        self.completion_tokens = Histogram(TOKEN_BUCKETS)
+        self.cached_prompt_tokens = 0
+        self.outcomes = Counter()   # success / error / cache_hit
+        self.retries = Counter()    # error class -> retried attempts
+        self.errors = Counter()     # error class -> requests that failed for good
+        self.predictions = Counter()  # survived / not_survived / unclear
+
+    def record_response(self, response, latency):
+        self.outcomes["success"] += 1
+        self.latency.observe(latency)
+        usage = response.usage
+        if usage is not None:
+            self.prompt_tokens.observe(usage.prompt_tokens)
+            self.completion_tokens.observe(usage.completion_tokens)
+            details = getattr(usage, "prompt_tokens_details", None)
+            self.cached_prompt_tokens += (getattr(details, "cached_tokens", None) or 0)
+
+    def record_retry(self, error):
+        self.retries[type(error).__name__] += 1
+
+    def record_error(self, error, latency):
+        self.outcomes["error"] += 1
+        self.errors[type(error).__name__] += 1
+        self.latency.observe(latency)
+
+    def record_cache_hit(self):
+        self.outcomes["cache_hit"] += 1
+
+    def record_prediction(self, survived):
+        self.predictions[{1: "survived", 0: "not_survived"}.get(survived, "unclear")] += 1
+
+    def cost(self):
+        # Lazy import: pricing is only needed once a cost is asked for
+        from utils.cost_estimation import get_pricing
+        try:
+            pricing = get_pricing(self.model)
+        except KeyError:
+            return None
+        return (self.prompt_tokens.sum / 1e6 * pricing["input"]
+                + self.completion_tokens.sum / 1e6 * pricing["output"])
+
+    def summary(self):
+        elapsed = time.time() - self.started
+        n_predictions = sum(self.predictions.values())
+        return {
+            "model": self.model,
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec='seconds'),
+            "elapsed_seconds": elapsed,
+            "requests": dict(self.outcomes),
+            "requests_per_second": sum(self.outcomes.values()) / elapsed if elapsed else None,
+            "retries": dict(self.retries),
+            "errors": dict(self.errors),
+            "latency_seconds": self.latency.summary(),
+            "prompt_tokens": self.prompt_tokens.summary(),
+            "completion_tokens": self.completion_tokens.summary(),
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "estimated_cost_usd": self.cost(),
+            "predictions": dict(self.predictions),
+            "unclear_rate": self.predictions["unclear"] / n_predictions if n_predictions else None,
+        }
+
+    def prometheus(self):
+        # Prometheus text exposition format, for node_exporter's textfile collector
+        model = self.model.replace('\\', '\\\\').replace('"', '\\"')
+        lines = [
+            "# HELP llm_request_duration_seconds Chat completion latency, including retries.",
+            "# TYPE llm_request_duration_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(self.latency.buckets, self.latency.counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            lines.append(f'llm_request_duration_seconds_bucket{{model="{model}",le="{le}"}} {cumulative}')
+        lines.append(f'llm_request_duration_seconds_sum{{model="{model}"}} {self.latency.sum}')
+        lines.append(f'llm_request_duration_seconds_count{{model="{model}"}} {self.latency.count}')
+
+        counters = [
+            ("llm_requests_total", "Requests by outcome.", "outcome", self.outcomes),
+            ("llm_retries_total", "Retried attempts by error class.", "error", self.retries),
+            ("llm_errors_total", "Failed requests by error class.", "error", self.errors),
+            ("llm_predictions_total", "Parsed predictions by result.", "prediction", self.predictions),
+            ("llm_tokens_total", "Tokens billed by type.", "type", {
+                "prompt": self.prompt_tokens.sum, "completion": self.completion_tokens.sum,
+                "cached_prompt": self.cached_prompt_tokens,
+            }),
+        ]
+        for name, help_text, label, values in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for key, value in sorted(values.items()):
+                lines.append(f'{name}{{model="{model}",{label}="{key}"}} {int(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def _write(self, path, text):
+        # Write then rename, so readers (and the textfile collector) never see a partial file
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    def maybe_snapshot(self):
+        if self.snapshot_interval and time.monotonic() - self.last_snapshot >= self.snapshot_interval:
+            self.last_snapshot = time.monotonic()
+            self._write(os.path.join(self.output_dir, 'snapshot.json'), json.dumps(self.summary(), indent=2))
+            self._write(os.path.join(self.output_dir, 'llm_predictions.prom'), self.prometheus())
+
+    def write(self):
+        stamp = datetime.fromtimestamp(self.started, timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        summary_path = os.path.join(self.output_dir, f"summary_{stamp}.json")
+        self._write(summary_path, json.dumps(self.summary(), indent=2))
+        self._write(os.path.join(self.output_dir, 'llm_predictions.prom'), self.prometheus())
+        return summary_path
+
+def print_summary(summary):
+    latency = summary["latency_seconds"]
+    print(f"Telemetry for {summary['model']}: {summary['requests']}")
+    if latency["count"]:
+        print(f"  latency p50 {latency['p50']:.2f}s, p90 {latency['p90']:.2f}s, p99 {latency['p99']:.2f}s, "
+              f"max {latency['max']:.2f}s")
+    print(f"  tokens: {summary['prompt_tokens']['sum']:.0f} prompt, {summary['completion_tokens']['sum']:.0f} completion "
+          f"({summary['cached_prompt_tokens']} prompt tokens cached)")
+    if summary["estimated_cost_usd"] is not None:
+        print(f"  estimated cost: ${summary['estimated_cost_usd']:.4f}")
+    if summary["retries"] or summary["errors"]:
+        print(f"  retries: {summary['retries']}, errors: {summary['errors']}")
+    if summary["unclear_rate"] is not None:
+        print(f"  unclear predictions: {summary['unclear_rate']:.1%}")
@@ -1,43 +1,53 @@
 from openai import OpenAI
-import json
-import os
-from config import TEST_OUTPUT
+from openai.types.chat import ChatCompletion
+import argparse
+from itertools import islice
+from config import TEST_OUTPUT, MODEL
+from response_cache import ResponseCache, cache_key
+from utils.jsonl_io import iter_jsonl
 
 fp=TEST_OUTPUT
 
 
-model="gpt-4o-mini-2024-07-18"  # baseline model
+def get_completion(client, cache, messages, model=MODEL):
+    key = cache_key(model, messages)
+    cached = cache.get(key)
+    if cached is not None:
+        return ChatCompletion.model_validate(cached)
 
-# fine-tuned model ID
-# model="ft:gpt-4o-mini-2024-07-18:personal::A1fNulFL"  # claude v2
-
-
-
-# Load the formatted JSONL test data (with PassengerId)
-with open(fp, 'r') as jsonl_file:
-    test_data = [json.loads(line) for line in jsonl_file]
-
-# Initialize the OpenAI client
-client = OpenAI()
-# openai.api_key = os.getenv("OPENAI_API_KEY")
-
-# Define the number of prompts to test (e.g., 5 for a quick inspection)
-test_batch_size = 1
-
-
-
-# Loop through the first few prompts and inspect the LLM responses
-for i, entry in enumerate(test_data[:test_batch_size]):
     response = client.chat.completions.create(
-        model=model, 
-        messages=entry['messages']
+        model=model,
+        messages=messages
     )
-    
-    predicted_response = response.choices[0].message
-    print(f"PassengerId: {entry['PassengerId']}")
-    print(f"User Prompt: {entry['messages'][1]['content']}")
-    print(f"LLM Response: {predicted_response}")
-    print("-" * 50)  # Separator for readability
-
-# Optionally, print a message if you want to track when the test finishes
-
+    cache.put(key, model, response.model_dump(mode='json'))
+    return response
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect LLM responses for the first few test passengers")
+    # Define the number of prompts to test (e.g., 5 for a quick inspection)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--model', default=MODEL, help="model id (config.MODEL by default)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="bypass the on-disk response cache and always call the API")
+    args = parser.parse_args()
+    test_batch_size = args.batch_size
+
+    # Initialize the OpenAI client
+    client = OpenAI()
+    cache = ResponseCache(enabled=not args.no_cache)
+
+    # Loop through the first few prompts and inspect the LLM responses; only those lines are read
+    for i, entry in enumerate(islice(iter_jsonl(fp), test_batch_size)):
+        response = get_completion(client, cache, entry['messages'], args.model)
+
+        predicted_response = response.choices[0].message
+        print(f"PassengerId: {entry['PassengerId']}")
+        print(f"User Prompt: {entry['messages'][1]['content']}")
+        print(f"LLM Response: {predicted_response}")
+        print("-" * 50)  # Separator for readability
+
+    print(f"Response cache: {cache.stats()}")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
-import pandas as pd
-import tiktoken
-import json
+import argparse
+import hashlib
+import os
+from collections import Counter, defaultdict
+from functools import lru_cache
+from config import TEST_FILE
+from utils.jsonl_io import iter_jsonl, iter_batches
 
 # Constants for Estimation
 MAX_TOKENS_PER_EXAMPLE = 16385
@@ -10,40 +14,235 @@ MAX_TARGET_EXAMPLES = 25000
 MIN_DEFAULT_EPOCHS = 1
 MAX_DEFAULT_EPOCHS = 25
 MODEL_NAME = "gpt-4o-mini-2024-07-18"  # Replace with your model if different
+MIN_CACHEABLE_PREFIX_TOKENS = 1024  # OpenAI only caches prompt prefixes at least this long
+
+# USD per 1M tokens; fine-tuned models are billed at the "ft" rates
+PRICING = {
+    "gpt-4o-mini-2024-07-18": {"input": 0.15, "output": 0.60, "training": 3.00},
+    "ft:gpt-4o-mini-2024-07-18": {"input": 0.30, "output": 1.20},
+}
+BATCH_DISCOUNT = 0.5  # Batch API requests are billed at half price
+EXPECTED_OUTPUT_TOKENS = 350  # typical step-by-step reasoning answer
+
+# Token accounting
+ACCOUNTING_BATCH_SIZE = 2048  # conversations tokenized per encode_batch call
+TOKEN_MEMO_BYTES = 32 << 20  # memory for token counts remembered between batches
+MEMO_ENTRY_BYTES = 136  # 16-byte digest key, int count and dict slot, measured with tracemalloc
+
+@lru_cache(maxsize=None)
+def get_encoding(model=MODEL_NAME):
+    # Lazy import: only token counting needs tiktoken, not the pricing helpers
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
 
 def get_token_length(messages, model=MODEL_NAME):
-    encoding = tiktoken.encoding_for_model(model)
+    encoding = get_encoding(model)
     total_tokens = sum(len(encoding.encode(message["content"])) for message in messages)
     return total_tokens
 
-def estimate_cost(jsonl_data):
-    convo_lens = [get_token_length(convo["messages"]) for convo in jsonl_data]
-    
+class TokenCounter:
+    # Counts tokens per message content. Repeated contents (the system message, shared
+    # instructions) are tokenized once; new contents are tokenized with encode_batch threads.
+    # The memo is keyed by a digest of the content, so unique multi-KB prompts cost a fixed
+    # MEMO_ENTRY_BYTES each instead of their full text.
+    def __init__(self, model=MODEL_NAME, num_threads=None, memo_bytes=TOKEN_MEMO_BYTES):
+        self.encoding = get_encoding(model)
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.memo_entries = max(1, memo_bytes // MEMO_ENTRY_BYTES)
+        self.memo = {}
+
+    def count_many(self, texts):
+        keys = [hashlib.blake2b(text.encode(), digest_size=16).digest() for text in texts]
+        unique = dict(zip(keys, texts))
+        # Counts are read from this batch's own lookup, so clearing a full memo cannot drop them
+        counts = {key: self.memo.get(key) for key in unique}
+        missing = [key for key, n_tokens in counts.items() if n_tokens is None]
+        if missing:
+            tokens = self.encoding.encode_batch([unique[key] for key in missing], num_threads=self.num_threads)
+            fresh = dict(zip(missing, map(len, tokens)))
+            counts.update(fresh)
+            if len(self.memo) + len(fresh) > self.memo_entries:
+                self.memo.clear()
+            self.memo.update(fresh)
+        return [counts[key] for key in keys]
+
+    def count(self, text):
+        return self.count_many([text])[0]
+
+class TokenDistribution:
+    # Exact min/percentiles/max from a histogram of counts, so memory is bounded by the
+    # number of distinct lengths rather than the number of rows
+    def __init__(self):
+        self.histogram = Counter()
+        self.total = 0
+        self.n = 0
+
+    def add(self, n_tokens):
+        self.histogram[n_tokens] += 1
+        self.total += n_tokens
+        self.n += 1
+
+    def merge(self, other):
+        self.histogram.update(other.histogram)
+        self.total += other.total
+        self.n += other.n
+
+    def percentile(self, q):
+        rank = max(1, -(-self.n * q // 100))  # ceil, nearest-rank method
+        seen = 0
+        for value in sorted(self.histogram):
+            seen += self.histogram[value]
+            if seen >= rank:
+                return value
+        return None
+
+    def summary(self):
+        if not self.n:
+            return {"n": 0, "total": 0}
+        return {
+            "n": self.n,
+            "total": self.total,
+            "mean": self.total / self.n,
+            "min": min(self.histogram),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": max(self.histogram),
+        }
+
+def account_tokens(jsonl_data, model=MODEL_NAME, batch_size=ACCOUNTING_BATCH_SIZE, num_threads=None):
+    # Single streaming pass: token distributions per role and per conversation
+    counter = TokenCounter(model, num_threads=num_threads)
+    by_role = defaultdict(TokenDistribution)
+    per_example = TokenDistribution()
+    n_billing_tokens = 0
+
+    for batch in iter_batches(jsonl_data, batch_size):
+        contents = [message["content"] for convo in batch for message in convo["messages"]]
+        counts = iter(counter.count_many(contents))
+        for convo in batch:
+            convo_tokens = 0
+            for message in convo["messages"]:
+                n_tokens = next(counts)
+                by_role[message["role"]].add(n_tokens)
+                convo_tokens += n_tokens
+            per_example.add(convo_tokens)
+            n_billing_tokens += min(MAX_TOKENS_PER_EXAMPLE, convo_tokens)
+
+    return {
+        "n_examples": per_example.n,
+        "per_example": per_example.summary(),
+        "by_role": {role: dist.summary() for role, dist in by_role.items()},
+        "n_billing_tokens": n_billing_tokens,
+    }
+
+def get_epochs(n_train_examples):
     # Calculate epochs based on the dataset size
-    n_train_examples = len(convo_lens)
     n_epochs = TARGET_EPOCHS
     if n_train_examples * TARGET_EPOCHS < MIN_TARGET_EXAMPLES:
         n_epochs = min(MAX_DEFAULT_EPOCHS, MIN_TARGET_EXAMPLES // n_train_examples)
     elif n_train_examples * TARGET_EPOCHS > MAX_TARGET_EXAMPLES:
         n_epochs = max(MIN_DEFAULT_EPOCHS, MAX_TARGET_EXAMPLES // n_train_examples)
+    return n_epochs
+
+def get_pricing(model):
+    if model.startswith("ft:"):
+        return PRICING["ft:" + model.split(":")[1]]
+    return PRICING[model]
+
+def estimate_cost(jsonl_data, model=MODEL_NAME):
+    return estimate_training_cost(account_tokens(jsonl_data, model), model)
+
+def estimate_training_cost(stats, model=MODEL_NAME):
+    n_billing_tokens_in_dataset = stats["n_billing_tokens"]
+    n_epochs = get_epochs(stats["n_examples"])
 
     # Estimate the total tokens billed
-    n_billing_tokens_in_dataset = sum(min(MAX_TOKENS_PER_EXAMPLE, length) for length in convo_lens)
     total_billed_tokens = n_epochs * n_billing_tokens_in_dataset
-    
+
     print(f"Dataset has ~{n_billing_tokens_in_dataset} tokens that will be charged during training.")
     print(f"By default, you'll train for {n_epochs} epochs on this dataset.")
     print(f"Estimated tokens charged: ~{total_billed_tokens} tokens")
+    training_price = PRICING.get(model, {}).get("training")
+    if training_price is not None:
+        print(f"Estimated training cost: ~${total_billed_tokens / 1e6 * training_price:.2f}")
 
     return total_billed_tokens
 
+def project_inference_cost(stats, model=MODEL_NAME, output_tokens=EXPECTED_OUTPUT_TOKENS):
+    # Prompt tokens are everything except assistant answers (present only in training files)
+    input_tokens = sum(dist["total"] for role, dist in stats["by_role"].items() if role != "assistant")
+    output_tokens = stats["n_examples"] * output_tokens
+    print(f"Inference on {stats['n_examples']} requests with {model}: "
+          f"{input_tokens} input + ~{output_tokens} output tokens")
+    try:
+        pricing = get_pricing(model)
+    except KeyError:
+        print(f"No pricing for {model}; add it to PRICING to project the cost")
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "cost": None, "batch_cost": None}
+    cost = input_tokens / 1e6 * pricing["input"] + output_tokens / 1e6 * pricing["output"]
+    print(f"Projected cost: ~${cost:.2f} online, ~${cost * BATCH_DISCOUNT:.2f} with the Batch API")
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+            "cost": cost, "batch_cost": cost * BATCH_DISCOUNT}
+
+def print_token_report(stats):
+    print(f"Num examples: {stats['n_examples']}")
+    rows = [("conversation", stats["per_example"])] + sorted(stats["by_role"].items())
+    print(f"{'':>13} {'total':>12} {'min':>7} {'p50':>7} {'p95':>7} {'max':>7}")
+    for name, dist in rows:
+        if dist["n"]:
+            print(f"{name:>13} {dist['total']:>12} {dist['min']:>7} {dist['p50']:>7} {dist['p95']:>7} {dist['max']:>7}")
+
+def compare_prompt_layouts(file_path=TEST_FILE, is_train=False, model=MODEL_NAME):
+    # Input tokens per request for every prompt layout in prompts.py, on the same passengers
+    from data_prep import prepare_data
+    from prompt_renderer import render_user_prompts
+    from prompts import PROMPT_LAYOUTS, SYSTEM_MESSAGE
+    counter = TokenCounter(model)
+    data = prepare_data(file_path, is_train=is_train)
+    system_tokens = counter.count(SYSTEM_MESSAGE)
+
+    report = {}
+    for layout in PROMPT_LAYOUTS:
+        prompts = render_user_prompts(data, is_train=is_train, layout=layout)
+        user_tokens = sum(counter.count_many(prompts))
+        # The system message plus the text every user prompt starts with is what a provider can cache
+        shared_prefix_tokens = system_tokens + counter.count(os.path.commonprefix(prompts))
+        report[layout] = {
+            "input_tokens": system_tokens * len(prompts) + user_tokens,
+            "avg_input_tokens": (system_tokens * len(prompts) + user_tokens) / len(prompts),
+            "shared_prefix_tokens": shared_prefix_tokens,
+        }
+
+    baseline = report["classic"]["input_tokens"]
+    print(f"Input tokens for {len(data)} passengers from {file_path}:")
+    for layout, stats in report.items():
+        stats["savings"] = 1 - stats["input_tokens"] / baseline
+        print(f"{layout:>8}: {stats['input_tokens']} tokens ({stats['avg_input_tokens']:.0f}/request), "
+              f"shared prefix {stats['shared_prefix_tokens']} tokens, {stats['savings']:.1%} fewer than classic")
+        if stats["shared_prefix_tokens"] < MIN_CACHEABLE_PREFIX_TOKENS:
+            print(f"          shared prefix is below the {MIN_CACHEABLE_PREFIX_TOKENS}-token minimum for prompt caching")
+    return report
+
 def main():
+    parser = argparse.ArgumentParser(description="Estimate token counts and fine-tuning cost")
     # Replace this with the path to your JSONL dataset
-    jsonl_data_path = 'data/test.jsonl'
-    with open(jsonl_data_path, 'r') as file:
-        jsonl_data = [json.loads(line) for line in file]
+    parser.add_argument('path', nargs='?', default='data/test.jsonl')
+    parser.add_argument('--model', default=MODEL_NAME, help="model used for inference cost projections")
+    parser.add_argument('--output-tokens', type=int, default=EXPECTED_OUTPUT_TOKENS,
+                        help="expected completion tokens per inference request")
+    parser.add_argument('--compare-layouts', action='store_true',
+                        help="report input tokens per prompt layout for the passengers in TEST_FILE")
+    args = parser.parse_args()
+
+    if args.compare_layouts:
+        compare_prompt_layouts()
+        return
 
-    estimate_cost(jsonl_data)
+    stats = account_tokens(iter_jsonl(args.path))
+    print_token_report(stats)
+    if "assistant" in stats["by_role"]:
+        estimate_training_cost(stats)
+    project_inference_cost(stats, args.model, args.output_tokens)
 
 if __name__ == "__main__":
     main()
@@ -1,56 +1,227 @@
-
-import json
-import tiktoken # for token counting
-import numpy as np
-from collections import defaultdict
+import argparse
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from utils.jsonl_io import loads, iter_jsonl
 
 data_path = "data/train/jsonl/claude_train_v2.jsonl"
 
-# Load the dataset
-with open(data_path, 'r', encoding='utf-8') as f:
-    dataset = [json.loads(line) for line in f]
-
-# Initial dataset stats
-print("Num examples:", len(dataset))
-print("First example:")
-for message in dataset[0]["messages"]:
-    print(message)
-
-# Format error checks
-format_errors = defaultdict(int)
+SHARD_MIN_BYTES = 16 << 20  # files smaller than this are validated in-process
+MAX_ERROR_LINES = 10  # line numbers kept per error type
+TOKEN_BATCH_SIZE = 2048
 
-for ex in dataset:
+def example_errors(ex, require_assistant=True):
+    # Format error checks for one example; returns the error types it has
+    errors = []
     if not isinstance(ex, dict):
-        format_errors["data_type"] += 1
-        continue
-        
+        return ["data_type"]
+
     messages = ex.get("messages", None)
     if not messages:
-        format_errors["missing_messages_list"] += 1
-        continue
-        
+        return ["missing_messages_list"]
+
+    # Fine-tuning ignores a per-example weight (balance_train_dataset_oversample.py --format weighted);
+    # only assistant messages take a 0/1 "weight"
+    if "weight" in ex:
+        errors.append("example_weight_unsupported")
+
     for message in messages:
         if "role" not in message or "content" not in message:
-            format_errors["message_missing_key"] += 1
-        
+            errors.append("message_missing_key")
+
         if any(k not in ("role", "content", "name", "function_call", "weight") for k in message):
-            format_errors["message_unrecognized_key"] += 1
-        
+            errors.append("message_unrecognized_key")
+
         if message.get("role", None) not in ("system", "user", "assistant", "function"):
-            format_errors["unrecognized_role"] += 1
-            
+            errors.append("unrecognized_role")
+
         content = message.get("content", None)
         function_call = message.get("function_call", None)
-        
+
         if (not content and not function_call) or not isinstance(content, str):
-            format_errors["missing_content"] += 1
-    
-    if not any(message.get("role", None) == "assistant" for message in messages):
-        format_errors["example_missing_assistant_message"] += 1
-
-if format_errors:
-    print("Found errors:")
-    for k, v in format_errors.items():
-        print(f"{k}: {v}")
-else:
-    print("No errors found")
\ No newline at end of file
+            errors.append("missing_content")
+
+    if require_assistant and not any(message.get("role", None) == "assistant" for message in messages):
+        errors.append("example_missing_assistant_message")
+
+    return errors
+
+def check_format(dataset):
+    # Format error checks over any iterable of examples, one example at a time
+    format_errors = defaultdict(int)
+    for ex in dataset:
+        for error in example_errors(ex):
+            format_errors[error] += 1
+    return format_errors
+
+class ValidationReport:
+    # Error counts with the first line numbers of each error type, plus token stats. Line numbers
+    # are relative to the start of the records seen, so shard reports are merged in file order.
+    def __init__(self, tokens=None):
+        self.n_lines = 0
+        self.n_examples = 0
+        self.errors = Counter()
+        self.error_lines = defaultdict(list)
+        self.tokens = tokens
+
+    def add_error(self, error, line_number):
+        self.errors[error] += 1
+        if len(self.error_lines[error]) < MAX_ERROR_LINES:
+            self.error_lines[error].append(line_number)
+
+    def merge(self, other):
+        for error, lines in other.error_lines.items():
+            room = MAX_ERROR_LINES - len(self.error_lines[error])
+            self.error_lines[error].extend(self.n_lines + line for line in lines[:room])
+        self.errors.update(other.errors)
+        self.n_lines += other.n_lines
+        self.n_examples += other.n_examples
+        if self.tokens is not None and other.tokens is not None:
+            self.tokens.merge(other.tokens)
+        return self
+
+class FormatValidator:
+    # Validates records one at a time. With fail_fast the first malformed record raises ValueError,
+    # which is how the JSONL writers stop a build on a bad row.
+    def __init__(self, require_assistant=True, fail_fast=False, count_tokens=False):
+        self.require_assistant = require_assistant
+        self.fail_fast = fail_fast
+        self.counter = None
+        tokens = None
+        if count_tokens:
+            # Lazy import: tiktoken is only needed for token stats
+            from utils.cost_estimation import TokenCounter, TokenDistribution
+            self.counter = TokenCounter(num_threads=1)
+            tokens = TokenDistribution()
+        self.report = ValidationReport(tokens)
+        self.pending = []  # valid examples waiting to be tokenized in one batch
+
+    def _fail(self, errors, line_number):
+        for error in errors:
+            self.report.add_error(error, line_number)
+        if errors and self.fail_fast:
+            raise ValueError(f"Malformed record on line {line_number}: {', '.join(errors)}")
+
+    def validate(self, ex):
+        self.report.n_lines += 1
+        self.report.n_examples += 1
+        errors = example_errors(ex, self.require_assistant)
+        self._fail(errors, self.report.n_lines)
+        if self.counter is not None and not errors:
+            self.pending.append(ex)
+            if len(self.pending) >= TOKEN_BATCH_SIZE:
+                self.flush_tokens()
+
+    def validate_line(self, line):
+        # One JSONL line as written or read; blank lines only advance the line number
+        if not line.strip():
+            self.report.n_lines += 1
+            return
+        try:
+            ex = loads(line)
+        except ValueError:
+            self.report.n_lines += 1
+            self._fail(["invalid_json"], self.report.n_lines)
+            return
+        self.validate(ex)
+
+    def flush_tokens(self):
+        if self.counter is None or not self.pending:
+            return
+        contents = [message["content"] for ex in self.pending for message in ex["messages"]]
+        counts = iter(self.counter.count_many(contents))
+        for ex in self.pending:
+            self.report.tokens.add(sum(next(counts) for _ in ex["messages"]))
+        self.pending = []
+
+    def finish(self):
+        self.flush_tokens()
+        return self.report
+
+def shard_ranges(path, n_shards):
+    size = os.path.getsize(path)
+    bounds = [size * i // n_shards for i in range(n_shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def iter_shard_lines(path, start, end):
+    # Lines that start inside [start, end); a line cut by `start` belongs to the previous shard
+    with open(path, 'rb') as f:
+        position = start
+        if start:
+            f.seek(start - 1)
+            if f.read(1) != b'\n':
+                position += len(f.readline())
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line
+
+def validate_shard(path, start, end, require_assistant=True, count_tokens=True):
+    validator = FormatValidator(require_assistant, count_tokens=count_tokens)
+    for line in iter_shard_lines(path, start, end):
+        validator.validate_line(line)
+    return validator.finish()
+
+def validate_file(path, workers=None, require_assistant=True, count_tokens=True):
+    # Byte-range shards validated in a process pool; reports are merged in file order
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or os.path.getsize(path) < SHARD_MIN_BYTES:
+        return validate_shard(path, 0, os.path.getsize(path), require_assistant, count_tokens)
+
+    ranges = shard_ranges(path, workers * 4)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        reports = pool.map(validate_shard, *zip(*[(path, start, end, require_assistant, count_tokens)
+                                                  for start, end in ranges]))
+        report = next(reports)
+        for shard_report in reports:
+            report.merge(shard_report)
+    return report
+
+def tokenizer_available():
+    try:
+        from utils.cost_estimation import get_encoding
+        get_encoding()
+        return True
+    except Exception:
+        return False
+
+def print_report(report):
+    print("Num examples:", report.n_examples)
+    if report.errors:
+        print("Found errors:")
+        for k, v in report.errors.items():
+            lines = ', '.join(map(str, report.error_lines[k]))
+            more = ", ..." if v > len(report.error_lines[k]) else ""
+            print(f"{k}: {v} (lines {lines}{more})")
+    else:
+        print("No errors found")
+
+    if report.tokens is not None and report.tokens.n:
+        stats = report.tokens.summary()
+        print(f"Tokens per example: min {stats['min']}, mean {stats['mean']:.0f}, p50 {stats['p50']}, "
+              f"p95 {stats['p95']}, max {stats['max']} ({stats['total']} total)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a fine-tuning JSONL file for format errors")
+    parser.add_argument('path', nargs='?', default=data_path)
+    parser.add_argument('--workers', type=int, default=None, help="processes to use (default: all cores)")
+    parser.add_argument('--test', action='store_true', help="test file: examples have no assistant message")
+    parser.add_argument('--no-tokens', action='store_true', help="skip the token-length stats")
+    args = parser.parse_args()
+
+    count_tokens = not args.no_tokens
+    if count_tokens and not tokenizer_available():
+        print("tiktoken encoding unavailable; skipping token stats")
+        count_tokens = False
+
+    print("First example:")
+    for message in next(iter_jsonl(args.path))["messages"]:
+        print(message)
+
+    report = validate_file(args.path, args.workers, require_assistant=not args.test, count_tokens=count_tokens)
+    print_report(report)
+
+if __name__ == "__main__":
+    main()
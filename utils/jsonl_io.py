@@ -0,0 +1,71 @@
+import json
+from itertools import islice
+
+# orjson parses several times faster than the json module; fall back when it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WRITE_BUFFER_SIZE = 1 << 20  # bytes
+
+def loads(line):
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+def dumps(record):
+    # Always the json module, so written files match json.dump(entry, f) byte for byte
+    return json.dumps(record)
+
+def iter_jsonl(path):
+    # Lazily yield one record per non-empty line
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+def iter_batches(records, batch_size):
+    # Group any record iterable (e.g. iter_jsonl) into lists of at most batch_size records
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def count_lines(path):
+    with open(path, 'rb') as f:
+        return sum(1 for line in f if line.strip())
+
+class JsonlWriter:
+    # `validator` (e.g. utils.format_validation.FormatValidator) checks every line before it is
+    # written, so a malformed record stops the build at that line
+    def __init__(self, path, buffer_size=WRITE_BUFFER_SIZE, validator=None):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8', buffering=buffer_size)
+        self.n_records = 0
+        self.validator = validator
+
+    def write(self, record):
+        if self.validator is not None:
+            self.validator.validate(record)
+        self.file.write(dumps(record) + '\n')
+        self.n_records += 1
+
+    def write_lines(self, lines):
+        # Lines that are already JSON-encoded and newline-terminated
+        for line in lines:
+            if self.validator is not None:
+                self.validator.validate_line(line)
+            self.file.write(line)
+            self.n_records += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,6 @@
+def percentile(values, q):
+    # Nearest-rank percentile of a list of samples; None when there are none
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]